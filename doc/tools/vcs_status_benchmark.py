@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Benchmark VcsRoot.status_subpath on a large, synthetic dirty repository
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import sys
+import time
+
+sys.path.insert(0, '../..')
+sys.path.insert(0, '.')
+
+ROOT = '/repo'
+DIRS = 5000
+CHANGES = 100000
+STATUSES = ('changed', 'staged', 'untracked', 'ignored', 'deleted')
+
+
+def main():
+    from ranger.ext.vcs.vcs import GitRoot
+
+    rootvcs = GitRoot.__new__(GitRoot)
+    rootvcs.path = ROOT
+    rootvcs.status_subpaths = {}
+    for i in range(CHANGES):
+        subpath = os.path.join('dir{0:d}'.format(i % DIRS), 'sub{0:d}'.format(i % 7),
+                               'file{0:d}'.format(i))
+        rootvcs.status_subpaths[subpath] = STATUSES[i % len(STATUSES)]
+
+    time1 = time.time()
+    rootvcs.status_dirs = rootvcs._status_dirs_build(  # pylint: disable=protected-access
+        rootvcs.status_subpaths)
+    time2 = time.time()
+    for i in range(DIRS):
+        rootvcs.status_subpath(os.path.join(ROOT, 'dir{0:d}'.format(i)), is_directory=True)
+    time3 = time.time()
+
+    print("build: %dms" % ((time2 - time1) * 1000))
+    print("lookup %d dirs: %dms" % (DIRS, (time3 - time2) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Benchmark the draw latency of W3MImageDisplayer against a fake w3mimgdisplay
+
+The fake answers size queries like the real one after a delay emulating its
+startup, so respawning it for every image, as ranger used to, shows up.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import fcntl
+import os
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+sys.path.insert(0, '../..')
+sys.path.insert(0, '.')
+
+IMAGES = 20
+ROUNDS = 5
+# Startup time of the fake w3mimgdisplay, in seconds
+STARTUP = 0.01
+
+FAKE_W3MIMGDISPLAY = '''#!{python}
+import sys, time
+if sys.argv[1:] == ['-test']:
+    print('1280 800')
+    sys.exit()
+time.sleep({startup})
+for line in iter(sys.stdin.readline, ''):
+    if line.startswith('5;'):
+        sys.stdout.write('640 480\\n')
+    elif line.startswith('4;'):
+        sys.stdout.write('\\n')
+    sys.stdout.flush()
+'''
+
+
+def measure(displayer, paths, respawn):
+    latencies = []
+    for _ in range(ROUNDS):
+        for path in paths:
+            time1 = time.time()
+            displayer.clear(0, 1, 80, 24)
+            displayer.draw(path, 0, 1, 80, 24)
+            while displayer.flush():
+                pass
+            if respawn:
+                displayer.quit()
+            latencies.append(time.time() - time1)
+    latencies.sort()
+    return (sum(latencies) / len(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def main():
+    from ranger.core.shared import FileManagerAware
+    from ranger.ext import img_display
+    from ranger.ext.openstruct import OpenStruct
+
+    FileManagerAware.fm_set(OpenStruct(settings=OpenStruct(w3m_delay=0)))
+    tmpdir = tempfile.mkdtemp()
+    fake = os.path.join(tmpdir, 'w3mimgdisplay')
+    with open(fake, 'w') as fobj:
+        fobj.write(FAKE_W3MIMGDISPLAY.format(python=sys.executable, startup=STARTUP))
+    os.chmod(fake, 0o755)
+    os.environ[img_display.W3MIMGDISPLAY_ENV] = fake
+    paths = []
+    for i in range(IMAGES):
+        paths.append(os.path.join(tmpdir, 'image{0:d}.png'.format(i)))
+        open(paths[-1], 'w').close()
+
+    # The font dimensions are read from the terminal on stdout
+    master, slave = os.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', 50, 160, 0, 0))
+    stdout = sys.stdout
+    sys.stdout = os.fdopen(slave, 'w')
+    try:
+        displayer = img_display.W3MImageDisplayer()
+        respawning = measure(displayer, paths, respawn=True)
+        displayer = img_display.W3MImageDisplayer()
+        persistent = measure(displayer, paths, respawn=False)
+        displayer.quit()
+    finally:
+        sys.stdout = stdout
+        os.close(master)
+
+    print("respawning per draw: mean %.2fms, p95 %.2fms" % respawning)
+    print("persistent session:  mean %.2fms, p95 %.2fms" % persistent)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+Benchmark fitting mixed-script filenames into a column, like BrowserColumn
+
+The old way is how WideString measured and cut strings: with lists of the
+characters, made with east_asian_width for every character, once for the
+name, the extension, the ellipsis and each slice.  The widths are measured
+with the string width cache cleared before every round (cold) and kept
+(warm), as on redraws of the same directory.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import sys
+import time
+from os.path import splitext
+from unicodedata import east_asian_width
+
+sys.path.insert(0, '../..')
+sys.path.insert(0, '.')
+
+NAMES = 10000
+ROUNDS = 5
+WIDTH = 24
+ELLIPSIS = u'~'
+ASCIIONLY = set(chr(c) for c in range(1, 128))
+SCRIPTS = (
+    ('ASCII', (u'report', u'backup', u'notes', u'IMG', u'final', u'draft')),
+    ('narrow', (u'données', u'Übersicht', u'фотография', u'αρχείο', u'café', u'señal')),
+    ('wide', (u'資料', u'プロジェクト', u'설정', u'日本語のファイル', u'🎵', u'写真')),
+)
+
+
+def names(words):
+    result = []
+    for i in range(NAMES):
+        parts = [words[(i * 7 + j * 3) % len(words)] for j in range(1 + i % 4)]
+        result.append(u'_'.join(parts) + u'_{0:d}.txt'.format(i))
+    return result
+
+
+def string_to_charlist(string):
+    if not set(string) - ASCIIONLY:
+        return list(string)
+    result = []
+    for char in string:
+        result.append(char)
+        if east_asian_width(char) in 'WF':
+            result.append(u'')
+    return result
+
+
+def charlist_slice(chars, stop):
+    if stop < len(chars) and chars[stop] == u'':
+        return u''.join(chars[:stop - 1]) + u' '
+    return u''.join(chars[:stop])
+
+
+def fit_charlists(strings):
+    for string in strings:
+        chars = string_to_charlist(string)
+        ext = string_to_charlist(splitext(string)[1])
+        ellipsis = string_to_charlist(ELLIPSIS)
+        if len(chars) > WIDTH:
+            cut = charlist_slice(chars, max(1, WIDTH - len(ext) - len(ellipsis)))
+            chars = string_to_charlist(cut) + ellipsis + ext
+        if len(chars) > WIDTH:
+            chars = string_to_charlist(charlist_slice(chars, WIDTH - len(ellipsis))) + ellipsis
+
+
+def fit_widths(strings, clear=None):
+    from ranger.ext.widestring import uwid, width_slice
+    if clear is not None:
+        clear()
+    for string in strings:
+        if uwid(string) > WIDTH:
+            ext = splitext(string)[1]
+            width = WIDTH - uwid(ext) - uwid(ELLIPSIS)
+            string = width_slice(string, 0, width) + ELLIPSIS + ext
+
+
+def measure(function, *args):
+    time1 = time.time()
+    for _ in range(ROUNDS):
+        function(*args)
+    return (time.time() - time1) / ROUNDS * 1000
+
+
+def main():
+    from ranger.ext import widestring
+
+    widestring.WIDTH_CACHE_MAX = NAMES
+    print("%d filenames per script, cut to %d columns" % (NAMES, WIDTH))
+    print("script   char lists   widths, cold   widths, warm")
+    clear = widestring._WIDTHS.clear  # pylint: disable=protected-access
+    for script, words in SCRIPTS:
+        strings = names(words)
+        old = measure(fit_charlists, strings)
+        cold = measure(fit_widths, strings, clear)
+        fit_widths(strings)
+        warm = measure(fit_widths, strings)
+        print("%-8s %8.1fms %12.1fms %12.1fms" % (script, old, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
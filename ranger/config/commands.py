@@ -805,6 +805,7 @@ class load_copy_buffer(Command):
 
         self.fm.copy_buffer = set(File(g)
                                   for g in fobj.read().split("\n") if exists(g))
+        self.fm.copy_buffer_version += 1
         fobj.close()
         self.fm.ui.redraw_main_column()
         return None
@@ -1509,6 +1510,19 @@ class scout(Command):
         return count == 1
 
 
+class pager_search(Command):
+    """:pager_search <pattern>
+
+    Search the pager for the regular expression pattern, case insensitive
+    unless it contains upper case letters.  Matches are highlighted, use
+    pager_search_next to go to the next or previous one.
+    """
+
+    def execute(self):
+        if self.rest(1):
+            self.fm.pager_search(self.rest(1))
+
+
 class narrow(Command):
     """
     :narrow
@@ -117,6 +117,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
     narrow_filter = None
     inode_type_filter = None
     marked_items = None
+    marked_size = 0
     scroll_begin = 0
 
     mount_path = '/'
@@ -154,6 +155,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
         FileSystemObject.__init__(self, path, **kw)
 
         self.marked_items = []
+        self._marked_sizes = {}
 
         self._signal_functions = []
         func = self.signal_function_factory(self.sort)
@@ -198,17 +200,37 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
     def get_list(self):
         return self.files
 
+    @staticmethod
+    def _marked_size_of(item):
+        # directories count once their cumulative size is calculated
+        if item.is_directory and not item.cumulative_size_calculated:
+            return 0
+        return item.size or 0
+
+    def count_marked_size(self):
+        """Recount marked_size, the total size of the marked items"""
+        self._marked_sizes = dict((item, self._marked_size_of(item))
+                                  for item in self.marked_items)
+        self.marked_size = sum(self._marked_sizes.values())
+
+    def _unmark_size(self, item):
+        # the size the item added when marked, it may have changed since
+        self.marked_size -= self._marked_sizes.pop(item, 0)
+
     def mark_item(self, item, val):
         item.mark_set(val)
         if val:
             if item in self.files and item not in self.marked_items:
                 self.marked_items.append(item)
+                self._marked_sizes[item] = self._marked_size_of(item)
+                self.marked_size += self._marked_sizes[item]
         else:
             while True:
                 try:
                     self.marked_items.remove(item)
                 except ValueError:
                     break
+            self._unmark_size(item)
 
     def toggle_mark(self, item):
         self.mark_item(item, not item.marked)
@@ -231,11 +253,14 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
         for item in list(self.marked_items):
             if item.path not in self.filenames:
                 self.marked_items.remove(item)
+                self._unmark_size(item)
 
     def _clear_marked_items(self):
         for item in self.marked_items:
             item.mark_set(False)
         del self.marked_items[:]
+        self._marked_sizes.clear()
+        self.marked_size = 0
 
     def get_selection(self):
         """READ ONLY"""
@@ -352,6 +377,9 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                                  for fname in filelist]
                     self.load_content_mtime = os.stat(mypath).st_mtime
 
+                # Repositories may have been created or removed in here
+                Vcs.root_cache_invalidate(mypath)
+
                 if self.cumulative_size_calculated:
                     # If self.content_loaded is true, this is not the first
                     # time loading.  So I can't really be sure if the
@@ -439,6 +467,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                         self.marked_items.append(item)
                     else:
                         item.mark_set(False)
+                self.count_marked_size()
 
                 self.sort()
 
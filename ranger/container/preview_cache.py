@@ -0,0 +1,480 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""The preview caches keep the previews of files in memory and on disk"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from hashlib import sha1
+import json
+import os
+import shutil
+from sys import version_info
+import tempfile
+from time import time
+import zlib
+
+from ranger.core.shared import FileManagerAware, SettingsAware
+
+# Bytes accounted for every entry, so entries without text are bounded too
+ENTRY_OVERHEAD = 256
+# Evict down to this fraction of the maximum size at once
+LOW_WATERMARK = 0.75
+
+
+class PreviewCache(SettingsAware):  # pylint: disable=too-many-instance-attributes
+    """A least recently used cache of previews, keyed by path
+
+    Every entry is a dict as used by Actions.get_preview:
+
+        cache['/tmp/foo.txt'][(80, 24)] = "the content..."
+        cache['/tmp/foo.txt']['loading'] = False
+
+    A -1 in a size tuple means "any"; (80, -1) = width of 80 and any height.
+    Previews stored with store() are accounted by their length. Once the
+    total exceeds the setting preview_cache_size, the least recently used
+    entries which are not loading are evicted.
+    """
+
+    def __init__(self, maxsize=None):
+        self._maxsize = maxsize
+        self._entries = {}
+        self._sizes = {}
+        self._ticks = {}
+        self._tick = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        """The maximum size in bytes, 0 means unlimited"""
+        if self._maxsize is None:
+            return self.settings.preview_cache_size
+        return self._maxsize
+
+    def _touch(self, path):
+        self._tick += 1
+        self._ticks[path] = self._tick
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, path):
+        entry = self._entries[path]
+        self._touch(path)
+        return entry
+
+    def __setitem__(self, path, entry):
+        if path in self._entries:
+            del self[path]
+        self._entries[path] = entry
+        self._sizes[path] = ENTRY_OVERHEAD + len(path)
+        self.size += self._sizes[path]
+        self._touch(path)
+        self.evict(keep=path)
+
+    def __delitem__(self, path):
+        del self._entries[path]
+        del self._ticks[path]
+        self.size -= self._sizes.pop(path)
+
+    def get(self, path, default=None):
+        try:
+            return self[path]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self._ticks.clear()
+        self.size = 0
+
+    def lookup(self, path, width, height):
+        """Returns the preview of path fitting the size, False if not cached"""
+        entry = self._entries.get(path)
+        if entry is not None:
+            for key in ((-1, -1), (width, -1), (-1, height), (width, height)):
+                if key in entry:
+                    self.hits += 1
+                    return entry[key]
+        self.misses += 1
+        return False
+
+    def store(self, path, key, content):
+        """Store the preview of path for the size key
+
+        The key tells which sizes the preview fits, as given by the exit code
+        of the preview script (see ranger.ext.previewers.size_key).  Previews
+        of the same path stored before for sizes which the key covers are
+        dropped, so a size-agnostic preview replaces them.
+        """
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        for other in [other for other in entry if isinstance(other, tuple)]:
+            if key[0] in (-1, other[0]) and key[1] in (-1, other[1]):
+                del entry[other]
+        entry[key] = content
+
+        size = ENTRY_OVERHEAD + len(path) + sum(
+            len(value) for other, value in entry.items()
+            if isinstance(other, tuple) and hasattr(value, '__len__'))
+        self.size += size - self._sizes[path]
+        self._sizes[path] = size
+        self._touch(path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Evict the least recently used entries if the cache is too large"""
+        maxsize = self.maxsize
+        if not maxsize or self.size <= maxsize:
+            return
+        for path in sorted(self._ticks, key=self._ticks.get):
+            if self.size <= maxsize * LOW_WATERMARK:
+                break
+            if path != keep and not self._entries[path].get('loading'):
+                del self[path]
+
+    def stats(self):
+        """Returns a dict with the statistics of the cache"""
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class PreviewDiskCache(FileManagerAware, SettingsAware):
+    """Compressed texts from the preview script, kept on disk across sessions
+
+    Every preview is stored in its own file under cachedir/previews, named
+    after the identity of the previewed file (realpath, size, mtime), the
+    size class given by the exit code of the preview script and script_id,
+    which identifies the script and its options. Any change of those makes
+    the entry unreachable. Once the cache exceeds the setting
+    preview_disk_cache_size, the least recently used files are deleted.
+    """
+
+    def __init__(self, path=None, maxsize=None):
+        self._path = path
+        self._maxsize = maxsize
+        self.size = None
+
+    @property
+    def path(self):
+        """The cache directory, None if the cache is disabled"""
+        if self._path is None:
+            return self.fm.cachepath('previews')
+        return self._path
+
+    @property
+    def maxsize(self):
+        """The maximum size in bytes, 0 disables the cache"""
+        if self._maxsize is None:
+            return self.settings.preview_disk_cache_size
+        return self._maxsize
+
+    def _filename(self, path, key, stat, script_id):
+        identity = '\0'.join([path, str(stat.st_size), repr(stat.st_mtime), repr(key),
+                              repr(script_id)])
+        if version_info[0] >= 3:
+            identity = identity.encode('utf-8', 'surrogateescape')
+        return os.path.join(self.path, sha1(identity).hexdigest())
+
+    def get(self, path, stat, width, height, script_id):
+        """
+        Returns the size key and the text of the cached preview of path fitting
+        the size, None if it is not cached
+        """
+        if not self.maxsize or self.path is None:
+            return None
+        for key in ((-1, -1), (width, -1), (-1, height), (width, height)):
+            filename = self._filename(path, key, stat, script_id)
+            try:
+                with open(filename, 'rb') as fobj:
+                    text = zlib.decompress(fobj.read())
+                os.utime(filename, None)
+            except (IOError, OSError, zlib.error):
+                continue
+            if version_info[0] >= 3:
+                text = text.decode('utf-8', 'surrogateescape')
+            return key, text
+        return None
+
+    def put(self, path, key, text, stat, script_id):
+        """Store the text of the preview of path for the size key
+
+        stat is the stat of path from before the preview was generated,
+        script_id a value identifying the preview script and its options.
+        """
+        if not self.maxsize or self.path is None or text is None:
+            return
+        if version_info[0] >= 3:
+            text = text.encode('utf-8', 'surrogateescape')
+        data = zlib.compress(text)
+        filename = self._filename(path, key, stat, script_id)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with open(filename + '.tmp', 'wb') as fobj:
+                fobj.write(data)
+            os.rename(filename + '.tmp', filename)
+        except (IOError, OSError):
+            return
+
+        if self.size is None:
+            self.clean()
+        else:
+            self.size += len(data)
+            if self.size > self.maxsize:
+                self.clean()
+
+    def clean(self):
+        """Delete the least recently used files until the cache fits"""
+        try:
+            names = os.listdir(self.path)
+        except (OSError, TypeError):
+            self.size = 0
+            return
+        entries = []
+        for name in names:
+            filename = os.path.join(self.path, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+
+        self.size = sum(size for _, size, _ in entries)
+        if self.size <= self.maxsize:
+            return
+        for _, size, filename in entries:
+            if self.size <= self.maxsize * LOW_WATERMARK:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self.size -= size
+
+
+class ThumbnailCache(SettingsAware):
+    """The images made by the preview script for image previews
+
+    The thumbnail of a file is kept in the directory path for every size
+    bucket, i.e. the smallest of THUMBNAIL_BUCKETS fitting the width of the
+    preview, so resizing the preview column does not scale a thumbnail of a
+    very different size.  The file name is derived from the realpath, mtime
+    and size of the file and the bucket, so changed files get new thumbnails.
+    Without a path, e.g. in clean mode, they are kept in a temporary
+    directory which is removed by destroy().
+
+    An index, saved as index.json on eviction and by destroy(), keeps the
+    key, size and time of last use of every thumbnail.  Once the thumbnails
+    exceed the setting preview_images_cache_size, the least recently used
+    ones are deleted.
+    """
+
+    BUCKETS = (32, 64, 128, 256)
+    INDEX = 'index.json'
+
+    def __init__(self, path, maxsize=None):
+        self._path = path
+        self.temporary = path is None
+        self._maxsize = maxsize
+        self._index = None
+        self._total = 0
+        self._dirty = False
+
+    @property
+    def path(self):
+        """The directory of the thumbnails"""
+        if self._path is None:
+            self._path = tempfile.mkdtemp(prefix='ranger_thumbnails_')
+        return self._path
+
+    @property
+    def maxsize(self):
+        """The maximum size in bytes, 0 means unlimited"""
+        if self._maxsize is None:
+            return self.settings.preview_images_cache_size
+        return self._maxsize
+
+    @property
+    def index(self):
+        """Maps file names to [path, mtime, size, bucket, bytes, last use]"""
+        if self._index is None:
+            self._index = self._index_load()
+            self._total = sum(entry[4] for entry in self._index.values())
+        return self._index
+
+    def _index_load(self):
+        try:
+            with open(os.path.join(self.path, self.INDEX), 'r') as fobj:
+                index = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def save(self):
+        """Write the index, merged with the one written by other instances"""
+        if not self._dirty:
+            return
+        index = self._index_load()
+        for name, entry in index.items():
+            if name in self.index and self.index[name][5] < entry[5]:
+                self.index[name][5] = entry[5]
+            elif name not in self.index and os.path.isfile(os.path.join(self.path, name)):
+                self.index[name] = entry
+                self._total += entry[4]
+        filename = os.path.join(self.path, self.INDEX)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with open(filename + '.tmp', 'w') as fobj:
+                json.dump(self.index, fobj)
+            os.rename(filename + '.tmp', filename)
+        except (IOError, OSError):
+            return
+        self._dirty = False
+
+    def destroy(self):
+        """Save the index, or remove the thumbnails if they are temporary"""
+        if not self.temporary:
+            self.save()
+        elif self._path is not None:
+            shutil.rmtree(self._path, ignore_errors=True)
+            self._path = self._index = None
+
+    def bucket(self, width):
+        """Returns the smallest bucket which fits the width"""
+        for bucket in self.BUCKETS:
+            if width <= bucket:
+                return bucket
+        return self.BUCKETS[-1]
+
+    def filename(self, path, stat, width):
+        """Returns the path of the thumbnail of path for the preview width"""
+        identity = '\0'.join([path, repr(stat.st_mtime), str(stat.st_size),
+                              str(self.bucket(width))])
+        if version_info[0] >= 3:
+            identity = identity.encode('utf-8', 'surrogateescape')
+        return os.path.join(self.path, sha1(identity).hexdigest() + '.jpg')
+
+    def prepare(self, path, stat, width):
+        """Returns the path the preview script should write the thumbnail to
+
+        The directory of the thumbnails is created if it doesn't exist yet.
+        """
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                pass
+        return self.filename(path, stat, width)
+
+    def get(self, path, stat, width):
+        """Returns the path of the thumbnail if it exists, None otherwise"""
+        filename = self.filename(path, stat, width)
+        if not os.path.isfile(filename):
+            return None
+        entry = self.index.get(os.path.basename(filename))
+        if entry is None:
+            self.add(path, stat, width)
+        else:
+            entry[5] = time()
+            self._dirty = True
+        return filename
+
+    def add(self, path, stat, width):
+        """Record the thumbnail of path, after the preview script made it"""
+        filename = self.filename(path, stat, width)
+        try:
+            size = os.stat(filename).st_size
+        except OSError:
+            return
+        name = os.path.basename(filename)
+        if name in self.index:
+            self._total -= self.index[name][4]
+        self.index[name] = [path, stat.st_mtime, stat.st_size, self.bucket(width), size, time()]
+        self._total += size
+        self._dirty = True
+        maxsize = self.maxsize
+        if maxsize and self._total > maxsize:
+            self.evict()
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+        entry = self.index.pop(name, None)
+        if entry is not None:
+            self._total -= entry[4]
+        self._dirty = True
+
+    def evict(self):
+        """Delete the least recently used thumbnails until the cache fits"""
+        for name in sorted(self.index, key=lambda name: self.index[name][5]):
+            if self._total <= self.maxsize * LOW_WATERMARK:
+                break
+            self._remove(name)
+        self.save()
+
+    @staticmethod
+    def _legacy_name(path):
+        """The name of the thumbnail of path in older versions of ranger"""
+        if version_info[0] < 3:
+            return sha1(path).hexdigest() + '.jpg'
+        return sha1(path.encode('utf-8', 'backslashreplace')).hexdigest() + '.jpg'
+
+    def clean(self):
+        """
+        Delete the thumbnails of changed and removed files, files which are
+        not in the index and thumbnails made by older versions of ranger of
+        the files in the index, then evict the least recently used thumbnails
+        if the cache is too large.  Returns the number of deleted files.
+        """
+        # Older versions kept the thumbnails in the cache directory itself
+        parent = os.path.dirname(self.path)
+        count = 0
+        for path in set(entry[0] for entry in self.index.values()):
+            try:
+                os.remove(os.path.join(parent, self._legacy_name(path)))
+            except OSError:
+                continue
+            count += 1
+
+        count += len(self.index)
+        for name, entry in list(self.index.items()):
+            try:
+                stat = os.stat(entry[0])
+            except OSError:
+                self._remove(name)
+                continue
+            if stat.st_mtime != entry[1] or stat.st_size != entry[2]:
+                self._remove(name)
+        if self.maxsize:
+            self.evict()
+        count -= len(self.index)
+
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+        for name in names:
+            if name != self.INDEX and name not in self.index:
+                self._remove(name)
+                count += 1
+
+        self._dirty = True
+        self.save()
+        return count
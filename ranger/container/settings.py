@@ -60,12 +60,18 @@ ALLOWED_SETTINGS = {
     'one_indexed': bool,
     'open_all_images': bool,
     'padding_right': bool,
+    'preview_cache_size': int,
+    'preview_delay': float,
     'preview_directories': bool,
+    'preview_disk_cache_size': int,
     'preview_files': bool,
     'preview_images': bool,
+    'preview_images_cache_size': int,
     'preview_images_method': str,
     'preview_max_size': int,
+    'preview_prefetch': int,
     'preview_script': (str, type(None)),
+    'preview_workers': int,
     'relative_current_zero': bool,
     'save_backtick_bookmark': bool,
     'save_console_history': bool,
@@ -86,6 +92,7 @@ ALLOWED_SETTINGS = {
     'unicode_ellipsis': bool,
     'update_title': bool,
     'update_tmux_title': bool,
+    'use_native_previewers': bool,
     'use_preview_script': bool,
     'vcs_aware': bool,
     'vcs_backend_bzr': str,
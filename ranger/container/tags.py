@@ -14,6 +14,8 @@ ALLOWED_KEYS = string.ascii_letters + string.digits + string.punctuation
 
 class Tags(object):
     default_tag = '*'
+    # Incremented whenever the tags are read, before any change
+    version = 0
 
     def __init__(self, filename):
 
@@ -80,6 +82,7 @@ class Tags(object):
             pass
         else:
             self.tags = self._parse(fobj)
+            self.version += 1
             fobj.close()
 
     def dump(self):
@@ -21,11 +21,14 @@ from sys import version_info
 from logging import getLogger
 
 import ranger
+from ranger.ext.encoding import file_encoding, is_ascii_compatible
 from ranger.ext.direction import Direction
 from ranger.ext.relative_symlink import relative_symlink
 from ranger.ext.keybinding_parser import key_to_string, construct_keybinding
+from ranger.ext.mapped_file import MappedFile
 from ranger.ext.shell_escape import shell_quote
 from ranger.ext.next_available_filename import next_available_filename
+from ranger.ext import previewers
 from ranger.ext.rifle import squash_flags, ASK_COMMAND
 from ranger.core.shared import FileManagerAware, SettingsAware
 from ranger.core.tab import Tab
@@ -67,7 +70,7 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         Reset the filemanager, clearing the directory buffer, reload rifle config
         """
         old_path = self.thisdir.path
-        self.previews = {}
+        self.previews.clear()
         self.garbage_collect(-1)
         self.enter_dir(old_path)
         self.change_mode('normal')
@@ -207,6 +210,8 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
     def get_cumulative_size(self):
         for fobj in self.thistab.get_selection() or ():
             fobj.look_up_cumulative_size()
+        if self.thisdir.marked_items:
+            self.thisdir.count_marked_size()
         self.ui.status.request_redraw()
         self.ui.redraw_main_column()
 
@@ -636,6 +641,27 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
     def pager_move(self, narg=None, **kw):
         self.ui.get_pager().move(narg=narg, **kw)
 
+    def pager_search(self, pattern, forward=True):
+        """Search the pager for a regular expression
+
+        The search is case insensitive unless the pattern contains upper
+        case letters.
+        """
+        flags = re.UNICODE  # pylint: disable=no-member
+        if pattern.lower() == pattern:
+            flags |= re.IGNORECASE
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error as ex:
+            self.notify('Bad pattern: {0}'.format(ex), bad=True)
+            return False
+        self.ui.get_pager().search(regex, forward=forward)
+        return True
+
+    def pager_search_next(self, forward=True):
+        """Search the pager for the next (or previous) match of the last search"""
+        return self.ui.get_pager().search_next(forward=forward)
+
     def taskview_move(self, narg=None, **kw):
         self.ui.taskview.move(narg=narg, **kw)
 
@@ -973,6 +999,9 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         if self.thisfile.is_image_preview():
             pager.set_image(fobj)
         else:
+            if self.previews.get(self.thisfile.realpath, {}).get('textpreview'):
+                # page through all of the file, not just the part previewed
+                fobj = self.open_text_file(self.thisfile.realpath) or fobj
             pager.set_source(fobj)
 
     # --------------------------
@@ -993,25 +1022,78 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         return os.path.join(ranger.args.cachedir,
                             sha1(path.encode('utf-8', 'backslashreplace')).hexdigest()) + '.jpg'
 
-    def get_preview(self, fobj, width, height):  # pylint: disable=too-many-return-statements
-        pager = self.ui.get_pager()
+    def get_preview(self, fobj, width, height,  # pylint: disable=too-many-return-statements
+                    prefetch=False):
+        """Returns the preview of fobj, or None if there is none (yet)
+
+        Previews are made by the previewers of ranger.ext.previewers or else
+        the preview script, run by fm.preview_pool.  With prefetch, the script
+        is queued after everything else in that queue.  Then the queued
+        CommandLoader is returned, or None if nothing had to be generated.
+        Files with previewers are skipped then, they run once the file is
+        shown, so prefetching never blocks the UI thread.
+        """
         path = fobj.realpath
 
         if not path or not os.path.exists(path):
             return None
 
         if not self.settings.preview_script or not self.settings.use_preview_script:
-            try:
-                # XXX: properly determine file's encoding
-                return codecs.open(path, 'r', errors='ignore')
-            # IOError for Python2, OSError for Python3
-            except (IOError, OSError):
+            return self.open_text_file(path)
+
+        data = self._preview_data(path)
+        if data is None:
+            return None
+        found = self.previews.lookup(path, width, height)
+        if found is not False:
+            return None if prefetch else found
+
+        if self.settings.use_native_previewers and \
+                not (self.settings.preview_images and fobj.image):
+            if prefetch and previewers.has_previewers(path):
+                return None
+            if self._preview_native(data, path, width, height):
+                return None if prefetch else self.previews.lookup(path, width, height)
+
+        script_stat = self._preview_script_stat()
+        if script_stat is None:
+            return None
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return None
+
+        image = self._preview_image_cached(data, path, path_stat, width)
+        if image is not None:
+            if prefetch:
                 return None
+            data['foundpreview'] = True
+            data['imagepreview'] = True
+            self.ui.get_pager().set_image(image)
+            return image
+
+        # Text previews of previous sessions
+        script_id = (script_stat.st_mtime, self.settings.preview_images)
+        cached = self.preview_disk_cache.get(path, path_stat, width, height, script_id)
+        if cached is not None:
+            data['foundpreview'] = True
+            self.previews.store(path, *cached)
+            return None if prefetch else cached[1]
+
+        loadable = self._preview_loader(data, path, path_stat, script_id, (width, height))
+        data['loading'] = True
+        if prefetch:
+            loadable.description = "Prefetching preview of %s" % path
+            self.preview_pool.add(loadable, append=True)
+            return loadable
+        self.cancel_preview(path)
+        self.preview_loader = (path, loadable)
+        self.preview_pool.add(loadable)
+        return None
 
-        # self.previews is a 2 dimensional dict:
-        # self.previews['/tmp/foo.jpg'][(80, 24)] = "the content..."
-        # self.previews['/tmp/foo.jpg']['loading'] = False
-        # A -1 in tuples means "any"; (80, -1) = wid. of 80 and any hei.
+    def _preview_data(self, path):
+        """Returns the entry of path in the preview cache, None while loading"""
+        # self.previews is a PreviewCache, see ranger.container.preview_cache.
         # The key 'foundpreview' is added later. Values in (True, False)
         # XXX: Previews can break when collapse_preview is on and the
         # preview column is popping out as you move the cursor on e.g. a
@@ -1023,19 +1105,24 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         else:
             if data['loading']:
                 return None
+        return data
 
-        found = data.get(
-            (-1, -1), data.get(
-                (width, -1), data.get(
-                    (-1, height), data.get(
-                        (width, height), False
-                    )
-                )
-            )
-        )
-        if found is not False:
-            return found
+    def _preview_native(self, data, path, width, height):
+        """Store the preview of a previewer in the preview cache, if one has it"""
+        result = previewers.preview(path, width, height)
+        if result is None:
+            return False
+        rcode, content = result
+        if rcode == 2:
+            data['textpreview'] = True
+            content = self.read_text_file(path, 1024 * 32)
+        data['foundpreview'] = rcode != 1
+        key = previewers.size_key(rcode, width, height) or (-1, -1)
+        self.previews.store(path, key, content if data['foundpreview'] else None)
+        return True
 
+    def _preview_script_stat(self):
+        """Returns the stat of the preview script, None if it can't be run"""
         try:
             stat_ = os.stat(self.settings.preview_script)
         except OSError:
@@ -1047,58 +1134,54 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
             self.fm.notify("Preview script `{0}` is not executable!".format(
                 self.settings.preview_script), bad=True)
             return None
+        return stat_
 
-        data['loading'] = True
-
+    def _preview_image_cached(self, data, path, path_stat, width):
+        """Returns the image to show for path if the script made one before"""
         if 'directimagepreview' in data:
-            data['foundpreview'] = True
-            data['imagepreview'] = True
-            pager.set_image(path)
-            data['loading'] = False
             return path
-
-        cacheimg = os.path.join(ranger.args.cachedir, self.sha1_encode(path))
         if self.settings.preview_images and \
-                os.path.isfile(cacheimg) and \
-                os.path.getmtime(cacheimg) > os.path.getmtime(path):
-            data['foundpreview'] = True
-            data['imagepreview'] = True
-            pager.set_image(cacheimg)
-            data['loading'] = False
-            return cacheimg
+                self.thumbnails.get(path, path_stat, width) is not None:
+            return self.thumbnails.filename(path, path_stat, width)
+        return None
+
+    def _preview_loader(self, data, path, path_stat, script_id, size):
+        """Returns a CommandLoader running the preview script for path"""
+        width, height = size
+        cacheimg = self.thumbnails.prepare(path, path_stat, width)
 
         def on_after(signal):
             rcode = signal.process.poll()
             content = signal.loader.stdout_buffer
             data['foundpreview'] = True
 
-            if rcode == 0:
-                data[(width, height)] = content
-            elif rcode == 3:
-                data[(-1, height)] = content
-            elif rcode == 4:
-                data[(width, -1)] = content
-            elif rcode == 5:
-                data[(-1, -1)] = content
+            key = previewers.size_key(rcode, width, height)
+            if key is not None:
+                self.previews.store(path, key, content)
+                self.preview_disk_cache.put(path, key, content, path_stat, script_id)
             elif rcode == 6:
                 data['imagepreview'] = True
+                self.thumbnails.add(path, path_stat, width)
             elif rcode == 7:
                 data['directimagepreview'] = True
             elif rcode == 1:
-                data[(-1, -1)] = None
+                self.previews.store(path, (-1, -1), None)
                 data['foundpreview'] = False
             elif rcode == 2:
-                data[(-1, -1)] = self.read_text_file(path, 1024 * 32)
+                data['textpreview'] = True
+                self.previews.store(path, (-1, -1), self.read_text_file(path, 1024 * 32))
             else:
-                data[(-1, -1)] = None
-
-            if self.thisfile and self.thisfile.realpath == path:
-                self.ui.browser.need_redraw = True
+                self.previews.store(path, (-1, -1), None)
 
             data['loading'] = False
 
+            # Prefetched previews are only shown once the cursor is on them
+            if not self.thisfile or self.thisfile.realpath != path:
+                return None
+            self.ui.browser.need_redraw = True
+
             pager = self.ui.get_pager()
-            if self.thisfile and self.thisfile.is_file:
+            if self.thisfile.is_file:
                 if 'imagepreview' in data:
                     pager.set_image(cacheimg)
                     return cacheimg
@@ -1122,41 +1205,57 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
             read=True,
             silent=True,
             descr="Getting preview of %s" % path,
+            delay=self.settings.preview_delay,
         )
         loadable.signal_bind('after', on_after)
         loadable.signal_bind('destroy', on_destroy)
-        self.loader.add(loadable)
+        return loadable
 
-        return None
+    def cancel_preview(self, path=None):
+        """Kill the generation of the preview in flight, unless it is of path"""
+        if self.preview_loader is None or self.preview_loader[0] == path:
+            return
+        loadable = self.preview_loader[1]
+        self.preview_loader = None
+        self.preview_pool.remove(loadable)
 
     @staticmethod
-    def read_text_file(path, count=None):
-        """Encoding-aware reading of a text file."""
+    def open_text_file(path):
+        """Returns the lines of a file for the pager, or None if it is unreadable
+
+        Files are memory-mapped, see ranger.ext.mapped_file, other than empty
+        and special files and ones in encodings like UTF-16, where a newline
+        isn't the byte b'\\n', which are read as a stream.
+        """
         try:
-            import chardet
-        except ImportError:
-            # Guess encoding ourselves. These should be the most frequently used ones.
-            encodings = ('utf-8', 'utf-16')
-            for encoding in encodings:
-                try:
-                    with codecs.open(path, 'r', encoding=encoding) as fobj:
-                        text = fobj.read(count)
-                except UnicodeDecodeError:
-                    pass
-                else:
-                    LOG.debug("guessed encoding of '%s' as %r", path, encoding)
-                    return text
-        else:
-            with open(path, 'rb') as fobj:
-                data = fobj.read(count)
-            result = chardet.detect(data)
-            LOG.debug("chardet guess for '%s': %s", path, result)
-            guessed_encoding = result['encoding']
-            return codecs.decode(data, guessed_encoding, 'replace')
+            encoding = file_encoding(path)
+        except (IOError, OSError):
+            return None
+        if is_ascii_compatible(encoding):
+            try:
+                return MappedFile(path, encoding=encoding)
+            except (IOError, OSError, ValueError):
+                pass
+        try:
+            return codecs.open(path, 'r', encoding=encoding, errors='replace')
+        # IOError for Python2, OSError for Python3
+        except (IOError, OSError):
+            return None
 
-        # latin-1 as the last resort
-        with codecs.open(path, 'r', encoding='latin-1', errors='replace') as fobj:
-            return fobj.read(count)
+    @staticmethod
+    def read_text_file(path, count=None):
+        """Encoding-aware reading of a text file.
+
+        The encoding is detected from the start of the file, see
+        ranger.ext.encoding, and remembered until the file is modified.
+        """
+        encoding = file_encoding(path)
+        LOG.debug("guessed encoding of '%s' as %r", path, encoding)
+        with open(path, 'rb') as fobj:
+            data = fobj.read(-1 if count is None else count)
+        # a read cut off at count may end inside of a character
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        return decoder.decode(data, count is None or len(data) < count)
 
     # --------------------------
     # -- Tabs
@@ -1379,6 +1478,7 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         Empty the copy buffer.
         """
         self.copy_buffer = set()
+        self.copy_buffer_version += 1
         self.do_cut = False
         self.ui.browser.main_column.request_redraw()
 
@@ -1411,6 +1511,7 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
             self.copy_buffer.difference_update(set(selected))
         elif mode == 'toggle':
             self.copy_buffer.symmetric_difference_update(set(selected))
+        self.copy_buffer_version += 1
         self.do_cut = False
         self.ui.browser.main_column.request_redraw()
 
@@ -7,6 +7,8 @@ from __future__ import (absolute_import, division, print_function)
 
 from time import time
 from collections import deque
+from logging import getLogger
+from multiprocessing import cpu_count
 import mimetypes
 import os.path
 import pwd
@@ -30,10 +32,15 @@ from ranger.ext.img_display import (W3MImageDisplayer, ITerm2ImageDisplayer,
 from ranger.core.metadata import MetadataManager
 from ranger.ext.rifle import Rifle
 from ranger.container.directory import Directory
+from ranger.ext.vcs import Vcs
+from ranger.container.preview_cache import PreviewCache, PreviewDiskCache, ThumbnailCache
 from ranger.ext.signals import SignalDispatcher
-from ranger.core.loader import Loader
+from ranger.core.loader import CommandPool, Loader
+from ranger.core.prefetcher import PreviewPrefetcher
 from ranger.ext import logutils
 
+LOG = getLogger(__name__)
+
 
 class FM(Actions,  # pylint: disable=too-many-instance-attributes
          SignalDispatcher):
@@ -60,10 +67,17 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         self.tags = tags
         self.restorable_tabs = deque([], ranger.MAX_RESTORABLE_TABS)
         self.py3 = sys.version_info >= (3, )
-        self.previews = {}
+        self.previews = PreviewCache()
+        self.preview_disk_cache = PreviewDiskCache()
+        self.thumbnails = ThumbnailCache(self.cachepath('thumbnails'))
+        self.preview_prefetcher = PreviewPrefetcher()
+        self.preview_loader = None
         self.default_linemodes = deque()
         self.loader = Loader()
+        self.preview_pool = CommandPool()
         self.copy_buffer = set()
+        # Incremented whenever the copy buffer changes
+        self.copy_buffer_version = 0
         self.do_cut = False
         self.metadata = MetadataManager()
         self.image_displayer = None
@@ -102,6 +116,8 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         self.rifle.reload_config()
 
         def set_image_displayer():
+            if self.image_displayer is not None:
+                self.image_displayer.quit()
             self.image_displayer = self._get_image_displayer()
         set_image_displayer()
         self.settings.signal_bind('setopt.preview_images_method', set_image_displayer,
@@ -112,6 +128,18 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             lambda signal: signal.fm.previews.clear(),
         )
 
+        def set_preview_workers():
+            self.preview_pool.size = self.settings.preview_workers or cpu_count()
+        set_preview_workers()
+        self.settings.signal_bind('setopt.preview_workers', set_preview_workers,
+                                  priority=settings.SIGNAL_PRIORITY_AFTER_SYNC)
+
+        def cancel_preview(signal):
+            if signal.tab is self.thistab:
+                self.cancel_preview(signal.new.realpath if signal.new else None)
+        self.signal_bind('move', cancel_preview)
+        self.signal_bind('move', self.preview_prefetcher.on_move)
+
         if ranger.args.clean:
             self.tags = TagsDummy("")
         elif self.tags is None:
@@ -214,6 +242,24 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             except Exception:  # pylint: disable=broad-except
                 if debug:
                     raise
+        if self.preview_pool:
+            try:
+                self.preview_pool.destroy()
+            except Exception:  # pylint: disable=broad-except
+                if debug:
+                    raise
+        LOG.debug("Preview cache: %(entries)d entries, %(size)d of %(maxsize)d bytes, "
+                  "%(hits)d hits, %(misses)d misses", self.previews.stats())
+        try:
+            self.thumbnails.destroy()
+        except Exception:  # pylint: disable=broad-except
+            if debug:
+                raise
+        try:
+            Vcs.cmdservers_close()
+        except Exception:  # pylint: disable=broad-except
+            if debug:
+                raise
 
     @staticmethod
     def get_log():
@@ -331,6 +377,13 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             return path_compat
         return os.path.join(ranger.args.datadir, *paths)
 
+    @staticmethod
+    def cachepath(*paths):
+        """returns path to ranger's cache directory, None in clean mode"""
+        if ranger.args.clean:
+            return None
+        return os.path.join(ranger.args.cachedir, *paths)
+
     @staticmethod
     def relpath(*paths):
         """returns the path relative to rangers library directory"""
@@ -379,6 +432,7 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         ui = self.ui
         throbber = ui.throbber
         loader = self.loader
+        preview_pool = self.preview_pool
         zombies = self.run.zombies
 
         ranger.api.hook_ready(self)
@@ -386,6 +440,7 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         try:  # pylint: disable=too-many-nested-blocks
             while True:
                 loader.work()
+                preview_pool.work(block=not loader.has_work())
                 if loader.has_work():
                     throbber(loader.status)
                 else:
@@ -393,7 +448,8 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
 
                 ui.redraw()
 
-                ui.set_load_mode(not loader.paused and loader.has_work())
+                ui.set_load_mode((not loader.paused and loader.has_work())
+                                 or preview_pool.has_work())
 
                 ui.draw_images()
 
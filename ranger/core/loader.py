@@ -11,14 +11,10 @@ import os.path
 import select
 import sys
 import errno
-
-try:
-    import chardet  # pylint: disable=import-error
-    HAVE_CHARDET = True
-except ImportError:
-    HAVE_CHARDET = False
+import threading
 
 from ranger.core.shared import FileManagerAware
+from ranger.ext.encoding import StreamDecoder
 from ranger.ext.signals import SignalDispatcher
 from ranger.ext.human_readable import human_readable
 
@@ -92,6 +88,7 @@ class CopyLoader(Loadable, FileManagerAware):  # pylint: disable=too-many-instan
         done = 0
         if self.do_cut:
             self.original_copy_buffer.clear()
+            self.fm.copy_buffer_version += 1
             if len(self.copy_buffer) == 1:
                 self.description = "moving: " + self.one_file.path + size_str
             else:
@@ -146,13 +143,17 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
     Output from stderr will be reported.  Ensure that the process doesn't
     ever ask for input, otherwise the loader will be blocked until this
     object is removed from the queue (type ^C in ranger)
+
+    With a delay, the process is only spawned that many seconds after this
+    object was created, so it can be destroyed before that.  The attribute
+    not_before holds that time and may be changed to postpone the process.
     """
     finished = False
     process = None
 
     def __init__(self, args, descr,  # pylint: disable=too-many-arguments
                  silent=False, read=False, input=None,  # pylint: disable=redefined-builtin
-                 kill_on_pause=False, popenArgs=None):
+                 kill_on_pause=False, popenArgs=None, delay=0):
         SignalDispatcher.__init__(self)
         Loadable.__init__(self, self.generate(), descr)
         self.args = args
@@ -162,9 +163,13 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
         self.input = input
         self.kill_on_pause = kill_on_pause
         self.popenArgs = popenArgs  # pylint: disable=invalid-name
+        self.not_before = time() + delay if delay else None
 
     def generate(self):  # pylint: disable=too-many-branches,too-many-statements
         py3 = sys.version_info[0] >= 3
+        while self.not_before is not None and time() < self.not_before:
+            yield
+            sleep(max(0, min(0.03, self.not_before - time())))
         popenargs = {} if self.popenArgs is None else self.popenArgs
         popenargs['stdout'] = popenargs['stderr'] = PIPE
         popenargs['stdin'] = PIPE if self.input else open(os.devnull, 'r')
@@ -190,6 +195,8 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
                 sleep(0.03)
         else:
             selectlist = []
+            # Chunks of the output may end inside of a character
+            decoder = StreamDecoder()
             if self.read:
                 selectlist.append(process.stdout)
             if not self.silent:
@@ -211,7 +218,7 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
                         elif robjs == process.stdout:
                             read = robjs.read(512)
                             if py3:
-                                read = safe_decode(read)
+                                read = decoder.decode(read)
                             if read:
                                 self.stdout_buffer += read
                 except select.error:
@@ -224,12 +231,15 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
             if self.read:
                 read = process.stdout.read()
                 if py3:
-                    read = safe_decode(read)
+                    read = decoder.decode(read, final=True)
                 self.stdout_buffer += read
         self.finished = True
         self.signal_emit('after', process=process, loader=self)
 
     def pause(self):
+        if self.process is None:
+            # Still waiting for the delay, nothing to pause
+            return
         if not self.finished and not self.paused:
             if self.kill_on_pause:
                 self.finished = True
@@ -248,6 +258,8 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
             self.signal_emit('pause', process=self.process, loader=self)
 
     def unpause(self):
+        if self.process is None:
+            return
         if not self.finished and self.paused:
             try:
                 self.process.send_signal(18)
@@ -266,14 +278,8 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
 
 
 def safe_decode(string):
-    try:
-        return string.decode("utf-8")
-    except UnicodeDecodeError:
-        if HAVE_CHARDET:
-            encoding = chardet.detect(string)["encoding"]
-            if encoding:
-                return string.decode(encoding, 'ignore')
-        return ""
+    """Decode the bytes as UTF-8 or else in the encoding detected for them"""
+    return StreamDecoder(errors='ignore').decode(string, final=True)
 
 
 class Loader(FileManagerAware):
@@ -440,3 +446,177 @@ class Loader(FileManagerAware):
     def destroy(self):
         while self.queue:
             self.queue.pop().destroy()
+
+
+class CommandPool(FileManagerAware):  # pylint: disable=too-many-instance-attributes
+    """
+    Runs CommandLoaders in parallel on a pool of threads, referenced as
+    fm.preview_pool
+
+    Unlike the Loader, which works on one object at a time, up to `size`
+    commands run at once, each one waited for by its own thread, so a slow
+    command never holds up anything else.  The signals "before" and "after"
+    of the CommandLoaders are emitted by work(), which is called from the
+    main loop, so their handlers run on the UI thread.
+    """
+    seconds_of_work_time = 0.03
+
+    def __init__(self, size=1):
+        self._size = size
+        self.queue = deque()
+        self.running = set()
+        self._started = deque()
+        self._finished = deque()
+        self._workers = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        """The maximum number of commands running at once"""
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        with self._cond:
+            self._size = max(1, value)
+            self._cond.notify_all()
+
+    def add(self, obj, append=False):
+        """Add a CommandLoader to the queue, see Loader.add"""
+        with self._cond:
+            while obj in self.queue:
+                self.queue.remove(obj)
+            if append:
+                self.queue.append(obj)
+            else:
+                self.queue.appendleft(obj)
+            if self._workers < self._size:
+                self._workers += 1
+                thread = threading.Thread(target=self._worker, name='CommandPool')
+                thread.daemon = True
+                thread.start()
+            self._cond.notify_all()
+
+    def remove(self, item):
+        """Remove a queued or running CommandLoader and destroy it"""
+        with self._cond:
+            if item in self.queue:
+                self.queue.remove(item)
+            elif item in self.running:
+                self.running.remove(item)
+            else:
+                return
+        item.destroy()
+
+    def _next(self):
+        """Wait for the next object which may run, None if the worker should stop
+
+        The caller must hold self._cond.
+        """
+        while not self._stopped and self._workers <= self._size:
+            now = time()
+            timeout = None
+            for obj in self.queue:
+                if obj.not_before is None or obj.not_before <= now:
+                    self.queue.remove(obj)
+                    self.running.add(obj)
+                    return obj
+                if timeout is None or obj.not_before - now < timeout:
+                    timeout = obj.not_before - now
+            self._cond.wait(timeout)
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                obj = self._next()
+                if obj is None:
+                    self._workers -= 1
+                    return
+            self._run(obj)
+
+    def _run(self, obj):
+        py3 = sys.version_info[0] >= 3
+        popenargs = {} if obj.popenArgs is None else dict(obj.popenArgs)
+        stdin = obj.input
+        if py3 and stdin is not None:
+            stdin = stdin.encode('utf-8')
+        with open(os.devnull, 'r+') as fd_devnull:
+            popenargs['stdin'] = PIPE if stdin else fd_devnull
+            popenargs['stdout'] = PIPE if obj.read else fd_devnull
+            popenargs['stderr'] = fd_devnull if obj.silent else PIPE
+            try:
+                process = Popen(obj.args, **popenargs)
+            except OSError as ex:
+                with self._cond:
+                    self._finished.append((obj, ex))
+                    self._cond.notify_all()
+                return
+        with self._cond:
+            obj.process = process
+            removed = obj not in self.running
+            if not removed:
+                self._started.append(obj)
+        if removed:
+            process.kill()
+
+        try:
+            stdout, stderr = process.communicate(stdin)
+        except (IOError, OSError):
+            stdout, stderr = None, None
+            process.kill()
+            process.wait()
+        if stdout:
+            obj.stdout_buffer += safe_decode(stdout) if py3 else stdout
+        obj.finished = True
+        with self._cond:
+            self._finished.append((obj, stderr))
+            self._cond.notify_all()
+
+    def work(self, block=True):
+        """Emit the signals of the started and finished commands
+
+        If block is true and no command has finished yet, wait up to
+        seconds_of_work_time for one.
+        """
+        with self._cond:
+            if block and not self._finished and (self.queue or self.running):
+                self._cond.wait(self.seconds_of_work_time)
+            started = list(self._started)
+            self._started.clear()
+            finished = list(self._finished)
+            self._finished.clear()
+
+        for obj in started:
+            if obj in self.running:
+                obj.signal_emit('before', process=obj.process, loader=obj)
+        for obj, stderr in finished:
+            with self._cond:
+                if obj not in self.running:
+                    continue
+                self.running.remove(obj)
+            if isinstance(stderr, Exception):
+                self.fm.notify('Failed to run {0}: {1}'.format(obj.description, stderr),
+                               bad=True)
+                continue
+            if stderr:
+                if sys.version_info[0] >= 3:
+                    stderr = safe_decode(stderr)
+                for line in stderr.splitlines():
+                    self.fm.notify(line, bad=True)
+            obj.signal_emit('after', process=obj.process, loader=obj)
+
+    def has_work(self):
+        """Is there anything queued or running?"""
+        return bool(self.queue or self.running)
+
+    def destroy(self):
+        with self._cond:
+            self._stopped = True
+            objs = list(self.queue) + list(self.running)
+            self.queue.clear()
+            self.running.clear()
+            self._cond.notify_all()
+        for obj in objs:
+            obj.destroy()
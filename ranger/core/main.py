@@ -133,6 +133,17 @@ def main(
                     print(chr(key))
             return 0
 
+        if args.clean_cache:
+            from ranger.ext.human_readable import human_readable
+            if not fm.thumbnails.temporary:
+                count = fm.thumbnails.clean()
+                print('Deleted {0:d} images from {1}'.format(count, fm.thumbnails.path))
+            if fm.preview_disk_cache.path is not None and fm.preview_disk_cache.maxsize:
+                fm.preview_disk_cache.clean()
+                print('Kept {0} of texts in {1}'.format(
+                    human_readable(fm.preview_disk_cache.size), fm.preview_disk_cache.path))
+            return 0
+
         if not sys.stdin.isatty():
             sys.stderr.write("Error: Must run ranger from terminal\n")
             raise SystemExit(1)
@@ -301,6 +312,8 @@ def parse_arguments():
                       help="Show only directories, no files or links")
     parser.add_option('--list-unused-keys', action='store_true',
                       help="List common keys which are not bound to any action.")
+    parser.add_option('--clean-cache', action='store_true',
+                      help="Delete outdated and excess previews from the cache and exit.")
     parser.add_option('--list-tagged-files', type='string', default=None,
                       metavar='tag',
                       help="List all files which are tagged with the given tag, default: *")
@@ -30,10 +30,13 @@ class MetadataManager(object):
         # metafile_cache maps .metadata.json filenames to their entries
         self.metafile_cache = dict()
         self.deep_search = DEEP_SEARCH_DEFAULT
+        # Incremented whenever the metadata changes
+        self.version = 0
 
     def reset(self):
         self.metadata_cache.clear()
         self.metafile_cache.clear()
+        self.version += 1
 
     def get_metadata(self, filename):
         try:
@@ -83,6 +86,7 @@ class MetadataManager(object):
         # Full update of the cache, to be on the safe side:
         self.metadata_cache[filename] = entry
         self.metafile_cache[metafile] = entries
+        self.version += 1
 
         with open(metafile, "w") as fobj:
             json.dump(entries, fobj, check_circular=True, indent=2)
@@ -0,0 +1,131 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""
+A prefetcher which generates previews ahead of the cursor.
+
+The previews of the next files in the direction the cursor is moving are
+queued at the end of the queue of fm.preview_pool, so they only run while it
+has nothing else to do, and only once the cursor has rested for the setting
+preview_delay.  Once the cursor reaches such a file, its preview is moved to
+the front of the queue.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from time import time
+
+from ranger.container.preview_cache import LOW_WATERMARK
+from ranger.core.shared import FileManagerAware, SettingsAware
+
+
+class PreviewPrefetcher(FileManagerAware, SettingsAware):
+    """Generates the previews of the files ahead of the cursor
+
+    At most `concurrency` prefetches are queued at once.  No prefetches are
+    started while the preview cache is filled above its low watermark, so
+    prefetching never evicts previews on its own.
+    """
+
+    @property
+    def concurrency(self):
+        """Leaves one worker of the preview pool for the current file"""
+        return max(1, self.fm.preview_pool.size - 1)
+
+    def __init__(self):
+        # The size of the preview column, set by it when drawing a preview
+        self.size = (0, 0)
+        # Maps the paths of the queued prefetches to their CommandLoaders
+        self.pending = {}
+        self.direction = 1
+        self._position = (None, None)
+
+    def on_move(self, signal):
+        """Handler of the signal "move", see ranger.core.tab.Tab"""
+        if signal.tab is not self.fm.thistab:
+            return
+        thisdir = signal.tab.thisdir
+        if thisdir is None:
+            self.cancel()
+            return
+        directory, pointer = self._position
+        if directory is thisdir and pointer != thisdir.pointer:
+            self.direction = 1 if thisdir.pointer > pointer else -1
+        elif directory is not thisdir:
+            self.direction = 1
+        self._position = (thisdir, thisdir.pointer)
+        self.schedule()
+
+    def _ahead(self):
+        """Returns the files ahead of the cursor which have a preview"""
+        thisdir = self.fm.thisdir
+        if thisdir is None or not thisdir.files:
+            return []
+        files = thisdir.files
+        result = []
+        for i in range(1, self.settings.preview_prefetch + 1):
+            index = thisdir.pointer + i * self.direction
+            if not 0 <= index < len(files):
+                break
+            fobj = files[index]
+            if fobj.is_file and fobj.has_preview():
+                result.append(fobj)
+        return result
+
+    def schedule(self):
+        """Cancel the prefetches which were passed and queue new ones"""
+        thisfile = self.fm.thisfile
+        if thisfile is not None:
+            current = self.pending.pop(thisfile.realpath, None)
+            if current is not None:
+                self.fm.cancel_preview(thisfile.realpath)
+                self.fm.preview_loader = (thisfile.realpath, current)
+                if current.process is None:
+                    current.not_before = time() + self.settings.preview_delay
+                self.fm.preview_pool.add(current)
+
+        if not self.settings.preview_prefetch or not all(self.size) \
+                or not self.settings.preview_script or not self.settings.use_preview_script:
+            self.cancel()
+            return
+
+        ahead = self._ahead()
+        paths = set(fobj.realpath for fobj in ahead)
+        for path in list(self.pending):
+            if path not in paths:
+                self.cancel(path)
+        not_before = time() + self.settings.preview_delay
+        for loadable in self.pending.values():
+            if loadable.process is None:
+                loadable.not_before = not_before
+
+        previews = self.fm.previews
+        for fobj in ahead:
+            if len(self.pending) >= self.concurrency:
+                break
+            if previews.maxsize and previews.size > previews.maxsize * LOW_WATERMARK:
+                break
+            path = fobj.realpath
+            if path in self.pending or path in previews:
+                continue
+            loadable = self.fm.get_preview(fobj, self.size[0], self.size[1], prefetch=True)
+            if loadable is not None:
+                self.pending[path] = loadable
+                loadable.signal_bind('after', self._on_done)
+                loadable.signal_bind('destroy', self._on_done)
+
+    def _on_done(self, signal):
+        for path, loadable in list(self.pending.items()):
+            if loadable is signal.loader:
+                del self.pending[path]
+                if signal.name == 'after':
+                    self.schedule()
+                break
+
+    def cancel(self, path=None):
+        """Cancel the prefetch of path, or all prefetches if path is None"""
+        paths = list(self.pending) if path is None else [path]
+        for path_ in paths:
+            loadable = self.pending.pop(path_, None)
+            if loadable is not None:
+                self.fm.preview_pool.remove(loadable)
@@ -0,0 +1,154 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""
+Detecting the encoding of text and decoding it.
+
+The encoding is guessed from a byte order mark, else from a small prefix of
+the text: UTF-16 if every other byte is a null byte, UTF-8 if it decodes as
+such, otherwise the guess of chardet if it is installed, or Latin-1, which
+decodes anything.  The encodings of files are remembered by their path and
+modification time.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import codecs
+import os
+
+try:
+    import chardet  # pylint: disable=import-error
+    HAVE_CHARDET = True
+except ImportError:
+    HAVE_CHARDET = False
+
+# The number of bytes looked at to detect an encoding
+SNIFF_SIZE = 4096
+# The number of file encodings to remember
+CACHE_MAX = 1024
+
+# utf-32 first, as its byte order marks start with the ones of utf-16
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_FILE_ENCODINGS = {}
+
+
+def detect(data):
+    """Guess the encoding of the bytes from their first SNIFF_SIZE bytes
+
+    >>> detect(codecs.BOM_UTF8 + b'abc')
+    'utf-8-sig'
+    >>> detect(u'\\xe4'.encode('utf-8') * 3000)
+    'utf-8'
+    >>> detect(u'abc'.encode('utf-16-le'))
+    'utf-16-le'
+    """
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+    data = data[:SNIFF_SIZE]
+    if b'\0' in data:
+        half = len(data) // 4
+        even, odd = data[0::2].count(b'\0'), data[1::2].count(b'\0')
+        if odd > half and not even:
+            return 'utf-16-le'
+        if even > half and not odd:
+            return 'utf-16-be'
+    try:
+        # not final, the prefix may end inside of a character
+        codecs.getincrementaldecoder('utf-8')().decode(data, False)
+    except UnicodeDecodeError:
+        pass
+    else:
+        return 'utf-8'
+    if HAVE_CHARDET:
+        encoding = chardet.detect(data)['encoding']
+        if encoding:
+            try:
+                return codecs.lookup(encoding).name
+            except LookupError:
+                pass
+    return 'latin-1'
+
+
+def file_encoding(path):
+    """Returns the encoding of the file, detected once per modification
+
+    Raises IOError/OSError if the file can't be read.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    encoding = _FILE_ENCODINGS.get(key)
+    if encoding is None:
+        with open(path, 'rb') as fobj:
+            encoding = detect(fobj.read(SNIFF_SIZE))
+        if len(_FILE_ENCODINGS) >= CACHE_MAX:
+            _FILE_ENCODINGS.clear()
+        _FILE_ENCODINGS[key] = encoding
+    return encoding
+
+
+def is_ascii_compatible(encoding):
+    """Is a newline of the encoding the byte b'\\n', like in ASCII?"""
+    return not codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32'))
+
+
+class StreamDecoder(object):  # pylint: disable=too-few-public-methods
+    """Decodes text arriving in chunks, like the output of a process
+
+    The text is decoded as UTF-8 until a chunk isn't valid UTF-8.  If there
+    were non-ASCII characters in valid UTF-8 before or that chunk has at
+    least as many of them as invalid bytes, the text stays UTF-8 and invalid
+    bytes are handled according to errors.  Otherwise the encoding is
+    detected once, from that chunk, and used from there on.  Characters
+    split between chunks are decoded once complete.
+
+    >>> decoder = StreamDecoder()
+    >>> data = u'\\xe4\\xf6'.encode('utf-8')
+    >>> decoder.decode(data[:1]) + decoder.decode(data[1:], final=True) == u'\\xe4\\xf6'
+    True
+    """
+
+    def __init__(self, errors='replace'):
+        self.errors = errors
+        self.encoding = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._utf8_seen = False
+
+    def _detect(self, data, final):
+        """Returns the encoding of the stream, given the first invalid chunk"""
+        if self._utf8_seen:
+            return 'utf-8'
+        text = codecs.getincrementaldecoder('utf-8')('replace').decode(data, final)
+        invalid = text.count(u'\ufffd')
+        if sum(1 for char in text if u'\x7f' < char != u'\ufffd') >= invalid:
+            return 'utf-8'
+        return detect(data)
+
+    def decode(self, data, final=False):
+        if self.encoding is None:
+            pending = self._decoder.getstate()[0]
+            try:
+                text = self._decoder.decode(data, final)
+            except UnicodeDecodeError:
+                data = pending + data
+                self.encoding = self._detect(data, final)
+                self._decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+            else:
+                # Multibyte characters make the text shorter than the bytes
+                # decoded, leaving out the ones of an incomplete character
+                if len(text) < len(pending) + len(data) - len(self._decoder.getstate()[0]):
+                    self._utf8_seen = True
+                return text
+        return self._decoder.decode(data, final)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
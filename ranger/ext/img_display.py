@@ -19,11 +19,15 @@ import imghdr
 import os
 import struct
 import sys
+import threading
 import warnings
+import zlib
 from subprocess import Popen, PIPE
+from time import time
 
 import termios
 from contextlib import contextmanager
+from io import BytesIO
 import codecs
 from tempfile import NamedTemporaryFile
 
@@ -70,6 +74,103 @@ class ImgDisplayUnsupportedException(Exception):
     pass
 
 
+def load_scaled_image(backend, path, box):
+    """Open an image with PIL and scale it down to fit into box (in pixels)
+
+    Instead of decoding the image at full size, JPEG images are decoded at a
+    reduced scale and other images are reduced by an integer factor first, so
+    only the last step resamples with LANCZOS.
+    """
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter('ignore', backend.DecompressionBombWarning)
+        image = backend.open(path)
+    if image.width <= box[0] and image.height <= box[1]:
+        return image
+    scale = min(box[0] / image.width, box[1] / image.height)
+    size = (max(1, int(scale * image.width)), max(1, int(scale * image.height)))
+    # a no-op for formats other than JPEG, the image stays at least as large as size
+    image.draft(image.mode, size)
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor >= 2 and hasattr(image, 'reduce'):  # pillow >= 7.0
+        image = image.reduce(factor)
+    return image.resize(size, backend.LANCZOS)
+
+
+class ImagePreparer(object):
+    """Prepares images for a displayer in a worker thread
+
+    The function, which decodes, scales and encodes an image, runs in the
+    worker.  Only the latest request is kept: it replaces the one still
+    waiting and results nobody asks for any more are dropped, so moving over
+    many images doesn't prepare every one of them.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.cond = threading.Condition()
+        self.thread = None
+        # the (key, args) requested last and the key taken by the worker last
+        self.wanted = None
+        self.taken = None
+        # the (key, payload, exception) for the wanted key
+        self.result = None
+        self.quitting = False
+
+    def prepare(self, key, *args):
+        """Request the payload for key, which function(*args) returns
+
+        Returns the tuple (payload, exception) once it is ready, else None.
+        Then call it again later, which doesn't start the work again.
+        """
+        with self.cond:
+            if self.result is not None and self.result[0] == key:
+                result = self.result[1:]
+                self.wanted = self.taken = self.result = None
+                return result
+            if self.wanted is None or self.wanted[0] != key:
+                self.wanted = (key, args)
+                self.result = None
+                self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name='ImagePreparer')
+                self.thread.daemon = True
+                self.thread.start()
+        return None
+
+    def busy(self):
+        """Is a payload requested which wasn't picked up yet?"""
+        return self.wanted is not None
+
+    def cancel(self):
+        """Drop the current request and its result"""
+        with self.cond:
+            self.wanted = self.taken = self.result = None
+
+    def quit(self):
+        with self.cond:
+            self.wanted = self.taken = self.result = None
+            self.quitting = True
+            self.cond.notify()
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.quitting and \
+                        (self.wanted is None or self.wanted[0] == self.taken):
+                    self.cond.wait()
+                if self.quitting:
+                    return
+                key, args = self.wanted
+                self.taken = key
+            try:
+                result = (key, self.function(*args), None)
+            except Exception as ex:  # pylint: disable=broad-except
+                result = (key, None, ex)
+            with self.cond:
+                if self.wanted is not None and self.wanted[0] == key:
+                    self.result = result
+
+
 class ImageDisplayer(object):
     """Image display provider functions for drawing images in the terminal"""
 
@@ -81,24 +182,49 @@ class ImageDisplayer(object):
         """Clear a part of terminal display."""
         pass
 
+    def flush(self):
+        """Send deferred drawing commands which are due
+
+        Returns whether commands are still deferred, then call it again soon.
+        """
+        return False
+
+    def terminal_resized(self):
+        """Called when the size of the terminal changed (SIGWINCH)"""
+        pass
+
     def quit(self):
         """Cleanup and close"""
         pass
 
 
-class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
+class W3MImageDisplayer(  # pylint: disable=too-many-instance-attributes
+        ImageDisplayer, FileManagerAware):
     """Implementation of ImageDisplayer using w3mimgdisplay, an utilitary
     program from w3m (a text-based web browser). w3mimgdisplay can display
     images either in virtual tty (using linux framebuffer) or in a Xorg session.
     Does not work over ssh.
 
     w3m need to be installed for this to work.
+
+    One w3mimgdisplay process serves all images of a session.  Commands are
+    buffered and sent along with the next size query, or by flush(), which
+    sends a drawing once the setting w3m_delay has passed.  The font
+    dimensions are remembered until the terminal is resized, the sizes of
+    images until they are modified.
     """
     is_initialized = False
+    # the number of image sizes to remember
+    image_sizes_max = 1000
 
     def __init__(self):
         self.binary_path = None
         self.process = None
+        self.font_dimensions = None
+        self.image_sizes = {}
+        self.commands = []
+        self.pending_draw = None
+        self.deadline = None
 
     def initialize(self):
         """start w3mimgdisplay"""
@@ -106,6 +232,9 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
         self.binary_path = self._find_w3mimgdisplay_executable()  # may crash
         self.process = Popen([self.binary_path] + W3MIMGDISPLAY_OPTIONS,
                              stdin=PIPE, stdout=PIPE, universal_newlines=True)
+        self.commands = []
+        self.pending_draw = None
+        self.deadline = None
         self.is_initialized = True
 
     @staticmethod
@@ -121,6 +250,8 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
     def _get_font_dimensions(self):
         # Get the height and width of a character displayed in the terminal in
         # pixels.
+        if self.font_dimensions is not None:
+            return self.font_dimensions
         if self.binary_path is None:
             self.binary_path = self._find_w3mimgdisplay_executable()
         farg = struct.pack("HHHH", 0, 0, 0, 0)
@@ -136,36 +267,67 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
             xpixels += 2
             ypixels += 2
 
-        return (xpixels // cols), (ypixels // rows)
+        self.font_dimensions = (xpixels // cols), (ypixels // rows)
+        return self.font_dimensions
 
-    def draw(self, path, start_x, start_y, width, height):
+    def terminal_resized(self):
+        self.font_dimensions = None
+
+    def _ensure_process(self):
         if not self.is_initialized or self.process.poll() is not None:
             self.initialize()
+
+    def _send(self, query=None):
+        """Write the buffered commands and the query, returns the answer to it"""
+        commands = ''.join(self.commands)
+        self.commands = []
+        if self.pending_draw is not None and query is None:
+            commands += self.pending_draw
+            self.pending_draw = None
+        self.deadline = None if self.pending_draw is None else self.deadline
+        if query is not None:
+            commands += query
+        if not commands:
+            return None
         try:
-            input_gen = self._generate_w3m_input(path, start_x, start_y, width, height)
-        except ImageDisplayError:
+            self.process.stdin.write(commands)
+            self.process.stdin.flush()
+        except IOError as ex:
+            if ex.errno == errno.EPIPE:
+                return None
             raise
+        if query is None:
+            return None
+        return self.process.stdout.readline()
+
+    def draw(self, path, start_x, start_y, width, height):
+        self._ensure_process()
+        self.pending_draw = self._generate_w3m_input(path, start_x, start_y, width, height)
 
         # Mitigate the issue with the horizontal black bars when
         # selecting some images on some systems. 2 milliseconds seems
         # enough. Adjust as necessary.
         if self.fm.settings.w3m_delay > 0:
-            from time import sleep
-            sleep(self.fm.settings.w3m_delay)
+            self.deadline = time() + self.fm.settings.w3m_delay
+        else:
+            self._send()
 
-        self.process.stdin.write(input_gen)
-        self.process.stdin.flush()
-        self.process.stdout.readline()
-        self.quit()
-        self.is_initialized = False
+    def flush(self):
+        if self.deadline is None:
+            return False
+        if time() < self.deadline:
+            return True
+        self._send()
+        return False
 
     def clear(self, start_x, start_y, width, height):
-        if not self.is_initialized or self.process.poll() is not None:
-            self.initialize()
+        self._ensure_process()
+        # drop an image which was not drawn yet
+        self.pending_draw = None
 
         fontw, fonth = self._get_font_dimensions()
 
-        cmd = "6;{x};{y};{w};{h}\n4;\n3;\n".format(
+        cmd = "6;{x};{y};{w};{h}\n3;\n".format(
             x=int((start_x - 0.2) * fontw),
             y=start_y * fonth,
             # y = int((start_y + 1) * fonth), # (for tmux top status bar)
@@ -173,15 +335,28 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
             h=height * fonth + 1,
             # h = (height - 1) * fonth + 1, # (for tmux top status bar)
         )
+        # sent with the next query or drawing, or by the next flush()
+        self.commands.append(cmd)
+        self.deadline = time()
 
+    def _get_image_size(self, path):
         try:
-            self.process.stdin.write(cmd)
-        except IOError as ex:
-            if ex.errno == errno.EPIPE:
-                return
-            raise
-        self.process.stdin.flush()
-        self.process.stdout.readline()
+            key = (path, os.stat(path).st_mtime)
+        except OSError as ex:
+            raise ImageDisplayError(str(ex))
+        size = self.image_sizes.get(key)
+        if size is not None:
+            return size
+
+        # the query goes out along with the buffered commands
+        output = (self._send("5;{}\n".format(path)) or '').split()
+        if len(output) != 2:
+            raise ImageDisplayError('Failed to execute w3mimgdisplay', output)
+        size = int(output[0]), int(output[1])
+        if len(self.image_sizes) >= self.image_sizes_max:
+            self.image_sizes.clear()
+        self.image_sizes[key] = size
+        return size
 
     def _generate_w3m_input(self, path, start_x, start_y, max_width, max_height):
         """Prepare the input string for w3mimgpreview
@@ -198,18 +373,7 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
         # (for tmux top status bar)
         # max_height_pixels = (max_height - 1) * fonth - 2
 
-        # get image size
-        cmd = "5;{}\n".format(path)
-
-        self.process.stdin.write(cmd)
-        self.process.stdin.flush()
-        output = self.process.stdout.readline().split()
-
-        if len(output) != 2:
-            raise ImageDisplayError('Failed to execute w3mimgdisplay', output)
-
-        width = int(output[0])
-        height = int(output[1])
+        width, height = self._get_image_size(path)
 
         # get the maximum image size preserving ratio
         if width > max_width_pixels:
@@ -219,7 +383,7 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
             width = (width * max_height_pixels) // height
             height = max_height_pixels
 
-        return "0;1;{x};{y};{w};{h};;;;;{filename}\n4;\n3;\n".format(
+        return "0;1;{x};{y};{w};{h};;;;;{filename}\n3;\n".format(
             x=int((start_x - 0.2) * fontw),
             y=start_y * fonth,
             # y = (start_y + 1) * fonth, # (for tmux top status bar)
@@ -231,6 +395,8 @@ class W3MImageDisplayer(ImageDisplayer, FileManagerAware):
     def quit(self):
         if self.is_initialized and self.process and self.process.poll() is None:
             self.process.kill()
+            self.process.wait()
+        self.is_initialized = False
 
 # TODO: remove FileManagerAwareness, as stuff in ranger.ext should be
 # ranger-independent libraries.
@@ -241,24 +407,59 @@ class ITerm2ImageDisplayer(ImageDisplayer, FileManagerAware):
     (http://iterm2.com/images.html).
 
     Ranger must be running in iTerm2 for this to work.
+
+    Images are read and encoded in the worker of an ImagePreparer.  With PIL
+    available, images larger than the preview are scaled down there, too.
     """
 
+    def __init__(self):
+        # the image to draw once the preparer has it ready
+        self.pending = None
+        self.preparer = ImagePreparer(self._generate_iterm2_input)
+
     def draw(self, path, start_x, start_y, width, height):
+        try:
+            key = (path, os.stat(path).st_mtime, width, height)
+        except OSError as ex:
+            raise ImageDisplayError(str(ex))
+        self.pending = (key, path, start_x, start_y, width, height)
+        self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return False
+        key, path, start_x, start_y, width, height = self.pending
+        result = self.preparer.prepare(key, path, width, height)
+        if result is None:
+            return True
+        self.pending = None
+        text, exception = result
+        if exception is not None:
+            raise ImageDisplayError(str(exception))
         with temporarily_moved_cursor(start_y, start_x):
-            sys.stdout.write(self._generate_iterm2_input(path, width, height))
+            sys.stdout.write(text)
+        return False
 
     def clear(self, start_x, start_y, width, height):
+        self.pending = None
+        self.preparer.cancel()
         self.fm.ui.win.redrawwin()
         self.fm.ui.win.refresh()
 
+    def quit(self):
+        self.preparer.quit()
+
     def _generate_iterm2_input(self, path, max_cols, max_rows):
         """Prepare the image content of path for image display in iTerm2"""
         image_width, image_height = self._get_image_dimensions(path)
         if max_cols == 0 or max_rows == 0 or image_width == 0 or image_height == 0:
             return ""
+        box = (self.fm.settings.iterm2_font_width * max_cols,
+               self.fm.settings.iterm2_font_height * max_rows)
+        fits = image_width <= box[0] and image_height <= box[1]
         image_width = self._fit_width(
             image_width, image_height, max_cols, max_rows)
-        content = self._encode_image_content(path)
+        content = self._encode_image_content(path, None if fits else box)
         display_protocol = "\033"
         close_protocol = "\a"
         if "screen" in os.environ['TERM']:
@@ -295,8 +496,20 @@ class ITerm2ImageDisplayer(ImageDisplayer, FileManagerAware):
         return width
 
     @staticmethod
-    def _encode_image_content(path):
-        """Read and encode the contents of path"""
+    def _encode_image_content(path, box=None):
+        """Read and encode the contents of path, scaled down to box if PIL is available"""
+        if box is not None:
+            try:
+                import PIL.Image
+            except ImportError:
+                pass
+            else:
+                image = load_scaled_image(PIL.Image, path, box)
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                    image = image.convert('RGBA')
+                stream = BytesIO()
+                image.save(stream, 'PNG', compress_level=1)
+                return base64.b64encode(stream.getvalue())
         with open(path, 'rb') as fobj:
             return base64.b64encode(fobj.read())
 
@@ -473,7 +686,7 @@ class URXVTImageFSDisplayer(URXVTImageDisplayer):
         return self._get_centered_offsets()
 
 
-class KittyImageDisplayer(ImageDisplayer):
+class KittyImageDisplayer(ImageDisplayer):  # pylint: disable=too-many-instance-attributes
     """Implementation of ImageDisplayer for kitty (https://github.com/kovidgoyal/kitty/)
     terminal. It uses the built APC to send commands and data to kitty,
     which in turn renders the image. The APC takes the form
@@ -500,6 +713,12 @@ class KittyImageDisplayer(ImageDisplayer):
     except (LookupError, TypeError):
         fsenc = 'utf-8'
 
+    # image ids kitty keeps for reuse, least recently drawn first
+    transmitted_max = 64
+    # kitty accepts at most 4096 bytes of payload per escape code
+    max_chunk_len = 4096
+    shm_dir = '/dev/shm'
+
     def __init__(self):
         # the rest of the initializations that require reading stdio or raising exceptions
         # are delayed to the first draw call, since curses
@@ -508,7 +727,15 @@ class KittyImageDisplayer(ImageDisplayer):
         # to init in _late_init()
         self.backend = None
         self.stream = None
+        self.shm = False
         self.pix_row, self.pix_col = (0, 0)
+        # maps (path, mtime, width, height) to the id of the image kitty has
+        self.transmitted = {}
+        self.transmitted_order = []
+        self.displayed = None
+        # the image to draw once the preparer has it ready
+        self.pending = None
+        self.preparer = ImagePreparer(self._prepare)
 
     def _late_init(self):
         # tmux
@@ -526,18 +753,14 @@ class KittyImageDisplayer(ImageDisplayer):
         with NamedTemporaryFile() as tmpf:
             tmpf.write(bytearray([0xFF] * 3))
             tmpf.flush()
-            for cmd in self._format_cmd_str(
-                    {'a': 'q', 'i': 1, 'f': 24, 't': 'f', 's': 1, 'v': 1, 'S': 3},
-                    payload=base64.standard_b64encode(tmpf.name.encode(self.fsenc))):
-                self.stdbout.write(cmd)
-            sys.stdout.flush()
-            resp = b''
-            while resp[-2:] != self.protocol_end:
-                resp += self.stdbin.read(1)
+            resp = self._command(
+                {'a': 'q', 'i': 1, 'f': 24, 't': 'f', 's': 1, 'v': 1, 'S': 3},
+                payload=base64.standard_b64encode(tmpf.name.encode(self.fsenc)))
         # set the transfer method based on the response
         # if resp.find(b'OK') != -1:
         if b'OK' in resp:
             self.stream = False
+            self.shm = self._probe_shm()
         elif b'EBADF' in resp:
             self.stream = True
         else:
@@ -562,105 +785,190 @@ class KittyImageDisplayer(ImageDisplayer):
         self.pix_row, self.pix_col = x_px_tot // n_rows, y_px_tot // n_cols
         self.needs_late_init = False
 
-    def draw(self, path, start_x, start_y, width, height):
-        self.image_id += 1
-        # dictionary to store the command arguments for kitty
-        # a is the display command, with T going for immediate output
-        # i is the id entifier for the image
-        cmds = {'a': 'T', 'i': self.image_id}
-        # sys.stderr.write('{}-{}@{}x{}\t'.format(start_x, start_y, width, height))
+    def _shm_name(self, image_id):
+        return '/ranger-kitty-{0:d}-{1:d}'.format(os.getpid(), image_id)
 
+    def _probe_shm(self):
+        """Can kitty read POSIX shared memory objects of ours?"""
+        if not os.path.isdir(self.shm_dir):
+            return False
+        name = self._shm_name(0)
+        shm_path = os.path.join(self.shm_dir, name[1:])
+        try:
+            with open(shm_path, 'wb') as fobj:
+                fobj.write(bytearray([0xFF] * 3))
+            resp = self._command(
+                {'a': 'q', 'i': 1, 'f': 24, 't': 's', 's': 1, 'v': 1, 'S': 3},
+                payload=base64.standard_b64encode(name.encode('ascii')))
+        except (IOError, OSError):
+            return False
+        finally:
+            # kitty unlinks the object once it read it
+            if os.path.exists(shm_path):
+                os.remove(shm_path)
+        return b'OK' in resp
+
+    def _read_response(self):
+        # catch kitty answer before the escape codes corrupt the console
+        resp = b''
+        while resp[-2:] != self.protocol_end:
+            resp += self.stdbin.read(1)
+        return resp
+
+    def _command(self, cmds, payload=None, position=None, response=True):
+        """Send a command, returns kitty's response if response is true"""
+        data = b''.join(self._format_cmd_str(cmds, payload=payload))
+        if position is None:
+            self.stdbout.write(data)
+            self.stdbout.flush()
+        else:
+            with temporarily_moved_cursor(int(position[1]), int(position[0])):
+                self.stdbout.write(data)
+        return self._read_response() if response else None
+
+    def draw(self, path, start_x, start_y, width, height):
         # finish initialization if it is the first call
         if self.needs_late_init:
             self._late_init()
 
-        with warnings.catch_warnings(record=True):  # as warn:
-            warnings.simplefilter('ignore', self.backend.DecompressionBombWarning)
-            image = self.backend.open(path)
-            # TODO: find a way to send a message to the user that
-            # doesn't stop the image from displaying
-            # if warn:
-            #     raise ImageDisplayError(str(warn[-1].message))
-        box = (width * self.pix_row, height * self.pix_col)
-
-        if image.width > box[0] or image.height > box[1]:
-            scale = min(box[0] / image.width, box[1] / image.height)
-            image = image.resize((int(scale * image.width), int(scale * image.height)),
-                                 self.backend.LANCZOS)
+        try:
+            key = (path, os.stat(path).st_mtime, width, height)
+        except OSError as ex:
+            raise ImageDisplayError(str(ex))
+
+        # Place an image kitty already has, unless kitty dropped it meanwhile
+        image_id = self.transmitted.get(key)
+        if image_id is not None:
+            resp = self._command({'a': 'p', 'i': image_id}, position=(start_x, start_y))
+            if b'OK' in resp:
+                self.transmitted_order.remove(key)
+                self.transmitted_order.append(key)
+                self.displayed = image_id
+                self.pending = None
+                self.preparer.cancel()
+                return
+            self._forget(key)
 
-        # start_x += ((box[0] - image.width) // 2) // self.pix_row
-        # start_y += ((box[1] - image.height) // 2) // self.pix_col
+        # The image is decoded and scaled in the worker, flush() sends it
+        box = (width * self.pix_row, height * self.pix_col)
+        self.pending = (key, path, box, start_x, start_y)
+        self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return False
+        key, path, box, start_x, start_y = self.pending
+        result = self.preparer.prepare(key, path, box)
+        if result is None:
+            return True
+        self.pending = None
+        prepared, exception = result
+        if exception is not None:
+            raise ImageDisplayError(str(exception))
+        self._transmit(key, prepared, start_x, start_y)
+        return False
+
+    def _prepare(self, path, box):
+        """Decode, scale and encode the image, runs in the worker of the preparer"""
+        image = load_scaled_image(self.backend, path, box)
+        if image.mode != 'RGB' and image.mode != 'RGBA':
+            image = image.convert('RGB')
+        data = image.tobytes()
+        # dictionary to store the command arguments for kitty
+        # a is the display command, with T going for immediate output
+        # f: size of a pixel fragment (8bytes per color)
+        # s, v: size of the image to recompose the flattened data
+        cmds = {'a': 'T', 'f': len(image.getbands()) * 8,
+                's': image.width, 'v': image.height}
         if self.stream:
-            # encode the whole image as base64
-            # TODO: implement z compression
-            # to possibly increase resolution in sent image
-            if image.mode != 'RGB' and image.mode != 'RGBA':
-                image = image.convert('RGB')
-            # t: transmissium medium, 'd' for embedded
-            # f: size of a pixel fragment (8bytes per color)
-            # s, v: size of the image to recompose the flattened data
-            # c, r: size in cells of the viewbox
-            cmds.update({'t': 'd', 'f': len(image.getbands()) * 8,
-                         's': image.width, 'v': image.height, })
-            payload = base64.standard_b64encode(
-                bytearray().join(map(bytes, image.getdata())))
+            # t: transmission medium, 'd' for embedded
+            # o: 'z' for zlib compressed data
+            cmds.update({'t': 'd', 'o': 'z'})
+            data = base64.standard_b64encode(zlib.compress(data))
+        elif self.shm:
+            # t: 's' for a shared memory object, kitty unlinks it for us
+            cmds.update({'t': 's', 'S': len(data)})
+        else:
+            # t: 't' for temporary file, kitty deletes it for us as its name
+            #   contains "tty-graphics-protocol"
+            cmds.update({'t': 't', 'o': 'z'})
+            data = zlib.compress(data, 1)
+        return cmds, data
+
+    def _transmit(self, key, prepared, start_x, start_y):
+        cmds, data = prepared
+        self.image_id += 1
+        # i is the id entifier for the image
+        cmds = dict(cmds, i=self.image_id)
+        shm_path = None
+        if cmds['t'] == 'd':
+            payload = data
+        elif cmds['t'] == 's':
+            name = self._shm_name(self.image_id)
+            shm_path = os.path.join(self.shm_dir, name[1:])
+            with open(shm_path, 'wb') as fobj:
+                fobj.write(data)
+            payload = base64.standard_b64encode(name.encode('ascii'))
         else:
-            # put the image in a temporary png file
-            # t: transmissium medium, 't' for temporary file (kitty will delete it for us)
-            # f: size of a pixel fragment (100 just mean that the file is png encoded,
-            #       the only format except raw RGB(A) bitmap that kitty understand)
-            # c, r: size in cells of the viewbox
-            cmds.update({'t': 't', 'f': 100, })
-            with NamedTemporaryFile(prefix='ranger_thumb_', suffix='.png', delete=False) as tmpf:
-                image.save(tmpf, format='png', compress_level=0)
+            with NamedTemporaryFile(prefix='ranger-tty-graphics-protocol-',
+                                    delete=False) as tmpf:
+                tmpf.write(data)
                 payload = base64.standard_b64encode(tmpf.name.encode(self.fsenc))
 
-        with temporarily_moved_cursor(int(start_y), int(start_x)):
-            for cmd_str in self._format_cmd_str(cmds, payload=payload):
-                self.stdbout.write(cmd_str)
-        # catch kitty answer before the escape codes corrupt the console
-        resp = b''
-        while resp[-2:] != self.protocol_end:
-            resp += self.stdbin.read(1)
-        if b'OK' in resp:
-            return
-        else:
+        try:
+            resp = self._command(cmds, payload=payload, position=(start_x, start_y))
+        finally:
+            if shm_path is not None and os.path.exists(shm_path):
+                os.remove(shm_path)
+        if b'OK' not in resp:
             raise ImageDisplayError('kitty replied "{}"'.format(resp))
 
+        self.transmitted[key] = self.image_id
+        self.transmitted_order.append(key)
+        self.displayed = self.image_id
+        while len(self.transmitted_order) > self.transmitted_max:
+            self._forget(self.transmitted_order[0])
+
+    def _forget(self, key):
+        """Make kitty free the data of a transmitted image"""
+        image_id = self.transmitted.pop(key)
+        self.transmitted_order.remove(key)
+        # d: 'I' deletes the placements of the image id and frees its data
+        # kitty doesn't reply on deletes
+        self._command({'a': 'd', 'd': 'I', 'i': image_id}, response=False)
+
     def clear(self, start_x, start_y, width, height):
         # let's assume that every time ranger call this
         # it actually wants just to remove the previous image
         # TODO: implement this using the actual x, y, since the protocol supports it
-        cmds = {'a': 'd', 'i': self.image_id}
-        for cmd_str in self._format_cmd_str(cmds):
-            self.stdbout.write(cmd_str)
-        self.stdbout.flush()
+        self.pending = None
+        self.preparer.cancel()
+        if self.displayed is None:
+            return
+        # d: 'i' deletes the placements of the image id, kitty keeps its data
         # kitty doesn't seem to reply on deletes, checking like we do in draw()
         # will slows down scrolling with timeouts from select
-        self.image_id -= 1
+        self._command({'a': 'd', 'd': 'i', 'i': self.displayed}, response=False)
+        self.displayed = None
 
-    def _format_cmd_str(self, cmd, payload=None, max_slice_len=2048):
+    def _format_cmd_str(self, cmd, payload=None, max_slice_len=None):
         central_blk = ','.join(["{}={}".format(k, v) for k, v in cmd.items()]).encode('ascii')
-        if payload is not None:
-            # we add the m key to signal a multiframe communication
-            # appending the end (m=0) key to a single message has no effect
-            while len(payload) > max_slice_len:
-                payload_blk, payload = payload[:max_slice_len], payload[max_slice_len:]
-                yield self.protocol_start + \
-                    central_blk + b',m=1;' + payload_blk + \
-                    self.protocol_end
-            yield self.protocol_start + \
-                central_blk + b',m=0;' + payload + \
-                self.protocol_end
-        else:
+        if payload is None:
             yield self.protocol_start + central_blk + b';' + self.protocol_end
+            return
+        if max_slice_len is None:
+            max_slice_len = self.max_chunk_len
+        # we add the m key to signal a multiframe communication, only the
+        # first chunk carries the keys; slicing a memoryview copies nothing
+        payload = memoryview(payload)
+        for offset in range(0, max(len(payload), 1), max_slice_len):
+            more = b'1' if offset + max_slice_len < len(payload) else b'0'
+            keys = central_blk + b',' if offset == 0 else b''
+            yield self.protocol_start + keys + b'm=' + more + b';' + \
+                payload[offset:offset + max_slice_len].tobytes() + self.protocol_end
 
     def quit(self):
-        # clear all remaining images, then check if all files went through or are orphaned
-        while self.image_id >= 1:
-            self.clear(0, 0, 0, 0)
-        # for k in self.temp_paths:
-        #     try:
-        #         os.remove(self.temp_paths[k])
-        #     except (OSError, IOError):
-        #         continue
+        self.preparer.quit()
+        # free the data of all images kitty keeps for us
+        while self.transmitted_order:
+            self._forget(self.transmitted_order[0])
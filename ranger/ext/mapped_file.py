@@ -0,0 +1,218 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""
+A read-only sequence of the lines of a file, for paging through large files.
+
+The file is memory-mapped and a sparse index stores the number of lines
+before every block of the file.  The index is built in a background thread,
+which only counts newlines, and once it reaches the end, the block size is
+doubled whenever the index would grow beyond INDEX_MAX entries.  Getting a
+line looks up its block and scans at most that block, so the memory used
+stays bounded however large the file is.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+# The initial block size in bytes and the maximum number of index entries
+BLOCK_SIZE = 65536
+INDEX_MAX = 65536
+# Files up to this size are indexed right away, without a thread
+SYNC_MAX = 1048576
+# Longer lines are cut off
+LINE_MAX = 65536
+# The number of bytes search() scans at a time
+SEARCH_CHUNK_SIZE = 1048576
+
+
+class MappedFile(object):  # pylint: disable=too-many-instance-attributes
+    """The lines of a file, decoded, without their line endings
+
+    Raises IOError/OSError if the file can't be mapped and ValueError if it
+    is empty.
+
+    Indexing starts when the lines are first accessed.  Until the index is
+    complete, len() only counts the lines indexed so far and the lines after
+    them raise an IndexError.
+    """
+
+    def __init__(self, path, encoding='utf-8', errors='replace'):
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self._fobj = open(path, 'rb')
+        try:
+            stat = os.fstat(self._fobj.fileno())
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+            # raises ValueError for empty files, like the ones in /proc
+            self._map = mmap.mmap(self._fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            self._fobj.close()
+            raise
+        # (block size, index), index[i] is the number of newlines before
+        # the offset i * block size
+        self._index = (BLOCK_SIZE, array('L', [0]))
+        # (offset, number of newlines before it) up to which it is indexed
+        self._indexed = (0, 0)
+        # (line, offset) of the line read last, to read on from there
+        self._cursor = (0, 0)
+        self._thread = None
+        self._stop = False
+        self.closed = False
+
+    @property
+    def complete(self):
+        """Is the whole file indexed?"""
+        return self._indexed[0] >= self.size
+
+    def same_file(self, other):
+        """Is other an open MappedFile of the same, unmodified file?"""
+        return isinstance(other, MappedFile) and not other.closed \
+            and other.path == self.path and other.size == self.size \
+            and other.mtime == self.mtime
+
+    def _start_indexing(self):
+        if self._thread is not None or self.complete or self._stop:
+            return
+        if self.size <= SYNC_MAX:
+            self._build_index()
+        else:
+            self._thread = threading.Thread(target=self._build_index, name='MappedFile')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _build_index(self):
+        offset, newlines = self._indexed
+        block, index = self._index
+        while offset < self.size and not self._stop:
+            end = min((offset // block + 1) * block, self.size)
+            try:
+                newlines += self._map[offset:end].count(b'\n')
+            except ValueError:  # closed meanwhile
+                return
+            offset = end
+            if end % block == 0 and end < self.size:
+                index.append(newlines)
+                if len(index) > INDEX_MAX:
+                    block *= 2
+                    index = index[::2]
+                    self._index = (block, index)
+            self._indexed = (offset, newlines)
+
+    def __len__(self):
+        self._start_indexing()
+        offset, newlines = self._indexed
+        if offset < self.size:
+            return newlines
+        # a last line without a line ending
+        if self._map[self.size - 1:self.size] != b'\n':
+            return newlines + 1
+        return newlines
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__  # Python 2
+
+    def _offset(self, number):
+        """Returns the offset of the line or None if it isn't indexed yet"""
+        if number == 0:
+            return 0
+        if number > self._indexed[1]:
+            return None
+        block, index = self._index
+        # the last block starting before the newline ending the previous line
+        i = bisect_left(index, number) - 1
+        line, offset = index[i], i * block
+        cursor_line, cursor_offset = self._cursor
+        if line <= cursor_line <= number and cursor_offset >= offset:
+            line, offset = cursor_line, cursor_offset
+        find = self._map.find
+        for _ in range(number - line):
+            offset = find(b'\n', offset) + 1
+        self._cursor = (number, offset)
+        return offset
+
+    def line_at(self, offset):
+        """Returns the number of the line at the offset"""
+        indexed, newlines = self._indexed
+        block, index = self._index
+        if offset >= indexed:
+            return newlines + self._map[indexed:offset].count(b'\n')
+        i = offset // block
+        return index[i] + self._map[i * block:offset].count(b'\n')
+
+    def _line_end(self, end):
+        """Leave out the newline before end, where "$" would match again"""
+        if end and self._map[end - 1:end] == b'\n':
+            return end - 1
+        return end
+
+    def search(self, regex, start, backward=False):
+        """Generate the number of the first line at or after start matching regex
+
+        With backward, the last matching line before start is searched.  The
+        compiled bytes pattern is matched against the raw file, one chunk of
+        whole lines at a time, and None is generated after every chunk, so
+        the search can be spread over time and stopped between chunks.
+        """
+        offset = self._offset(start)
+        if offset is None:
+            return
+        find, rfind = self._map.find, self._map.rfind
+        if not backward:
+            while offset < self.size:
+                end = min(offset + SEARCH_CHUNK_SIZE, self.size)
+                newline = find(b'\n', end, end + LINE_MAX)
+                if newline != -1:
+                    end = newline + 1
+                match = regex.search(self._map, offset, self._line_end(end))
+                if match is not None:
+                    yield self.line_at(match.start())
+                    return
+                offset = end
+                yield None
+            return
+        end = offset
+        while end > 0:
+            offset = max(0, end - SEARCH_CHUNK_SIZE)
+            newline = rfind(b'\n', max(0, offset - LINE_MAX), offset)
+            if newline != -1:
+                offset = newline + 1
+            match = None
+            for match in regex.finditer(self._map, offset, self._line_end(end)):
+                pass
+            if match is not None:
+                yield self.line_at(match.start())
+                return
+            end = offset
+            yield None
+
+    def __getitem__(self, number):
+        if not 0 <= number < len(self):
+            raise IndexError(number)
+        offset = self._offset(number)
+        if offset is None:
+            raise IndexError(number)
+        end = self._map.find(b'\n', offset, offset + LINE_MAX)
+        if end == -1:
+            end = min(offset + LINE_MAX, self.size)
+        line = self._map[offset:end]
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        return line.decode(self.encoding, self.errors)
+
+    def close(self):
+        self.closed = True
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+        self._map.close()
+        self._fobj.close()
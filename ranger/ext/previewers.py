@@ -0,0 +1,227 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""
+Previewers which run inside of ranger, without spawning the preview script.
+
+A previewer is a function taking the path, width and height of the preview
+and returning a tuple (exit code, text), where the exit code has the same
+meaning as the one of the preview script (see the PREVIEWS section in the
+manual), or None to pass the file on to the next previewer and finally the
+preview script.  Previewers run on the UI thread, so they must be fast and
+only read a bounded part of the file.
+
+Plugins can add their own previewers:
+
+    from ranger.ext.previewers import register
+
+    def preview_csv(path, width, height):
+        ...
+        return 5, text
+
+    register(preview_csv, 'csv')
+
+Extensions may consist of two parts, like 'tar.gz', which are tried before
+the last part alone.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import json
+import os
+import struct
+import tarfile
+import time
+import zipfile
+
+# The previewers for a file extension and the ones for any file
+PREVIEWERS = {}
+PREVIEWERS_ANY = []
+
+# The archive listings are cut off after this many entries
+LIST_MAX = 1000
+# The listings of compressed tar archives are cut off after this many bytes
+# were decompressed, since the members can only be skipped by decompressing
+TAR_DECOMPRESS_MAX = 4 * 1024 * 1024
+# Larger JSON files are shown as they are
+JSON_SIZE_MAX = 262143
+# Zip archives with a larger central directory, which is read as a whole,
+# are left to the preview script
+ZIP_DIRECTORY_MAX = 262144
+
+
+def register(function, *extensions):
+    """Register a previewer for the file extensions, or for any file
+
+    Previewers registered later are tried first.
+    """
+    if not extensions:
+        PREVIEWERS_ANY.insert(0, function)
+    for extension in extensions:
+        PREVIEWERS.setdefault(extension.lower(), []).insert(0, function)
+
+
+def _previewers(path):
+    parts = os.path.basename(path).lstrip('.').lower().split('.')[1:]
+    functions = []
+    if len(parts) >= 2:
+        functions += PREVIEWERS.get('.'.join(parts[-2:]), [])
+    if parts:
+        functions += PREVIEWERS.get(parts[-1], [])
+    return functions + PREVIEWERS_ANY
+
+
+def has_previewers(path):
+    """Are there previewers which may preview the file?"""
+    return bool(_previewers(path))
+
+
+def preview(path, width, height):
+    """Returns the (exit code, text) of the first matching previewer or None"""
+    for function in _previewers(path):
+        try:
+            result = function(path, width, height)
+        except (IOError, OSError):
+            continue
+        if result is not None:
+            return result
+    return None
+
+
+def size_key(code, width, height):
+    """Returns the size key of a text preview with the exit code, or None
+
+    >>> size_key(4, 80, 24)
+    (80, -1)
+    """
+    return {
+        0: (width, height),
+        3: (-1, height),
+        4: (width, -1),
+        5: (-1, -1),
+    }.get(code)
+
+
+def _listing(lines, count):
+    if count > LIST_MAX:
+        lines.append('... {0:d} more entries'.format(count - LIST_MAX))
+    return 5, '\n'.join(lines) + '\n'
+
+
+def preview_text(path, width, height):  # pylint: disable=unused-argument
+    """Plain text files are read by ranger itself"""
+    return 2, None
+
+
+def preview_json(path, width, height):  # pylint: disable=unused-argument
+    """Pretty-print JSON files"""
+    if os.path.getsize(path) > JSON_SIZE_MAX:
+        return 2, None
+    with open(path, 'rb') as fobj:
+        try:
+            data = json.loads(fobj.read().decode('utf-8'))
+        except ValueError:
+            return 2, None
+    return 5, json.dumps(data, indent=2, ensure_ascii=False) + '\n'
+
+
+def _zip_directory_size(fobj):
+    """Returns the size of the central directory of a zip archive or None"""
+    # The end of central directory record is at most 22 bytes plus a comment
+    # of up to 65535 bytes from the end
+    fobj.seek(0, os.SEEK_END)
+    fobj.seek(max(0, fobj.tell() - 22 - 65535))
+    data = fobj.read()
+    offset = data.rfind(b'PK\x05\x06')
+    if offset < 0 or len(data) < offset + 22:
+        return None
+    # Zip64 archives have 0xffffffff here, which is too large anyway
+    return struct.unpack('<I', data[offset + 12:offset + 16])[0]
+
+
+def preview_zip(path, width, height):  # pylint: disable=unused-argument
+    """List the contents of zip archives with a small central directory"""
+    try:
+        with open(path, 'rb') as fobj:
+            size = _zip_directory_size(fobj)
+            if size is None or size > ZIP_DIRECTORY_MAX:
+                return None
+            with zipfile.ZipFile(fobj) as archive:
+                infos = archive.infolist()
+    except (zipfile.BadZipfile, RuntimeError, ValueError, struct.error):
+        return None
+    lines = []
+    for info in infos[:LIST_MAX]:
+        lines.append('{0:>10d}  {1:04d}-{2:02d}-{3:02d} {4:02d}:{5:02d}  {6}'.format(
+            info.file_size, *(info.date_time[:5] + (info.filename,))))
+    return _listing(lines, len(infos))
+
+
+def preview_tar(path, width, height):  # pylint: disable=unused-argument
+    """List the contents of tar archives, reading no further than needed"""
+    compressed = not path.lower().endswith('.tar')
+    lines = []
+    count = 0
+    truncated = False
+    try:
+        with tarfile.open(path, 'r:*') as archive:
+            for info in archive:
+                count += 1
+                if count > LIST_MAX:
+                    truncated = True
+                    break
+                date = time.strftime('%Y-%m-%d %H:%M', time.localtime(info.mtime))
+                name = info.name + '/' if info.isdir() else info.name
+                lines.append('{0:>10d}  {1}  {2}'.format(info.size, date, name))
+                # The next member comes after the data of this one
+                if compressed and info.offset_data + info.size > TAR_DECOMPRESS_MAX:
+                    truncated = True
+                    break
+    except Exception:  # pylint: disable=broad-except
+        # tarfile.TarError, EOFError or errors of the decompressors
+        return None
+    if truncated:
+        lines.append('... more entries')
+        return 5, '\n'.join(lines) + '\n'
+    return _listing(lines, count)
+
+
+def _image_size(header):
+    """Returns the type, width and height of the image with the header or None"""
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+        return ('PNG',) + struct.unpack('>II', header[16:24])
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return ('GIF',) + struct.unpack('<HH', header[6:10])
+    if header.startswith(b'BM') and len(header) >= 26:
+        width, height = struct.unpack('<ii', header[18:26])
+        return 'BMP', width, abs(height)
+    if header.startswith(b'\xff\xd8'):
+        # Walk the JPEG segments up to the start of frame
+        offset = 2
+        while offset + 9 <= len(header):
+            marker, length = struct.unpack('>xBH', header[offset:offset + 4])
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                height, width = struct.unpack('>HH', header[offset + 5:offset + 9])
+                return 'JPEG', width, height
+            offset += 2 + length
+    return None
+
+
+def preview_image(path, width, height):  # pylint: disable=unused-argument
+    """Show the type and dimensions of images, found by their header"""
+    with open(path, 'rb') as fobj:
+        header = fobj.read(65536)
+    try:
+        result = _image_size(header)
+    except struct.error:
+        return None
+    if result is None:
+        return None
+    return 5, 'Image: {0}\nSize: {1:d}x{2:d}\n'.format(*result)
+
+
+register(preview_image, 'png', 'gif', 'bmp', 'jpg', 'jpeg', 'jpe', 'jfif')
+register(preview_text, 'txt', 'text', 'log')
+register(preview_json, 'json')
+register(preview_zip, 'zip', 'jar', 'war', 'xpi', 'whl', 'apk')
+register(preview_tar, 'tar', 'tar.gz', 'tgz', 'tar.bz2', 'tbz', 'tbz2', 'tar.xz', 'txz')
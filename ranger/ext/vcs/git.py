@@ -46,6 +46,33 @@ class Git(Vcs):
             return None
         return self._run(['for-each-ref', '--format=%(upstream)', ref]) or None
 
+    def _gitdir(self):
+        """Returns the git directory, following gitdir files of worktrees and submodules"""
+        if os.path.isfile(self.repodir):
+            try:
+                with open(self.repodir, 'r') as fobj:
+                    line = fobj.readline().strip()
+            except (OSError, IOError):
+                return self.repodir
+            if line.startswith('gitdir: '):
+                return os.path.normpath(os.path.join(self.root, line[8:]))
+        return self.repodir
+
+    @staticmethod
+    def _commondir(gitdir):
+        """Returns the common git directory of a worktree, gitdir otherwise"""
+        try:
+            with open(os.path.join(gitdir, 'commondir'), 'r') as fobj:
+                return os.path.normpath(os.path.join(gitdir, fobj.readline().strip()))
+        except (OSError, IOError):
+            return gitdir
+
+    def _head_ref_read(self, gitdir):
+        """Returns HEAD reference without running git, None if detached"""
+        with open(os.path.join(gitdir, self.HEAD), 'r') as fobj:
+            head = fobj.readline().strip()
+        return head[5:] if head.startswith('ref: ') else None
+
     def _log(self, refspec=None, maxres=None, filelist=None):
         """Returns an array of dicts containing revision info for refspec"""
         args = ['--no-pager', 'log', '--pretty=%h%x00%H%x00%an <%ae>%x00%ct%x00%s%x00%x00']
@@ -194,3 +221,89 @@ class Git(Vcs):
             return log[0]
         else:
             raise VcsError('More than one instance of revision {0:s}'.format(rev))
+
+    def data_root_info(self):  # pylint: disable=too-many-locals
+        gitdir = self._gitdir()
+        try:
+            head = self._head_ref_read(gitdir)
+        except (OSError, IOError):
+            try:
+                head = self._head_ref()
+            except VcsError:
+                # Detached
+                head = None
+        if head is None:
+            return {
+                'head': self.data_info(self.HEAD),
+                'branch': 'detached',
+                'upstream': None,
+                'remotestatus': 'none',
+                'ahead': None,
+                'behind': None,
+            }
+
+        match = re.match('refs/heads/([^/]+)', head)
+        info = {
+            'head': None,
+            'branch': match.group(1) if match else None,
+            'upstream': None,
+            'remotestatus': 'none',
+            'ahead': None,
+            'behind': None,
+        }
+
+        # One process for the head commit, its upstream and the ahead/behind counts
+        output = self._run([
+            'for-each-ref',
+            '--format=%(objectname:short)%00%(objectname)%00%(authorname) %(authoremail)%00'
+            '%(committerdate:unix)%00%(subject)%00%(upstream)%00%(upstream:track,nobracket)',
+            head,
+        ])
+        if not output:
+            # No commits yet
+            return info
+
+        commit_hash_abbrev, commit_hash, author, timestamp, subject, upstream, track = \
+            output.split('\n')[0].split('\0')
+        info['head'] = {
+            'short': commit_hash_abbrev,
+            'revid': commit_hash,
+            'author': string_control_replace(author, ' '),
+            'date': datetime.fromtimestamp(int(timestamp)),
+            'summary': string_control_replace(subject, ' '),
+        }
+        if upstream:
+            info['upstream'] = upstream
+            if track == 'gone':
+                info['remotestatus'] = 'unknown'
+                return info
+            counts = dict((key, 0) for key in ('ahead', 'behind'))
+            for count in track.split(', ') if track else ():
+                key, _, value = count.partition(' ')
+                counts[key] = int(value)
+            info.update(counts)
+            if counts['ahead']:
+                info['remotestatus'] = 'diverged' if counts['behind'] else 'ahead'
+            else:
+                info['remotestatus'] = 'behind' if counts['behind'] else 'sync'
+        return info
+
+    def data_outdated_signals(self, root_info=None):
+        gitdir = self._gitdir()
+        commondir = self._commondir(gitdir)
+        # Linked worktrees share the branches of the common directory
+        paths = [os.path.join(gitdir, path) for path in ('index', self.HEAD, 'FETCH_HEAD')]
+        paths += [os.path.join(commondir, path) for path in ('packed-refs', 'refs/heads')]
+
+        # The ref HEAD points to changes on commit, the upstream on fetch and push
+        try:
+            head = self._head_ref_read(gitdir)
+        except (OSError, IOError):
+            head = None
+        if head is not None:
+            paths.append(os.path.join(gitdir, head))
+            if commondir != gitdir:
+                paths.append(os.path.join(commondir, head))
+        if root_info and root_info['upstream']:
+            paths.append(os.path.join(commondir, root_info['upstream']))
+        return paths
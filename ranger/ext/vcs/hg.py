@@ -135,3 +135,7 @@ class Hg(Vcs):
             return log[0]
         else:
             raise VcsError('More than one instance of revision {0:s}'.format(rev))
+
+    def data_outdated_signals(self, root_info=None):  # pylint: disable=unused-argument
+        return [os.path.join(self.repodir, path) for path in
+                ('dirstate', 'branch', 'bookmarks', 'store/00changelog.i')]
@@ -0,0 +1,148 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""Client for Mercurial's command server protocol
+
+A command server is a single hg process answering commands on a pipe, which
+saves the startup cost of spawning hg for every command. Messages from the
+server are framed as a channel byte, a big-endian 32 bit length and data:
+
+    o  output of the command
+    e  error output of the command
+    r  return code of the command, as a big-endian 32 bit integer
+    I  request for input data, L request for an input line
+
+Lower case channels are optional and may be ignored by the client.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import struct
+import subprocess
+import threading
+
+
+class CommandServerError(Exception):
+    """Command server exception"""
+    pass
+
+
+class CommandServer(object):
+    """A persistent `hg serve --cmdserver pipe` process
+
+    The process is started on the first command. If it dies or violates the
+    protocol, it is restarted and the command is retried once. If it can't be
+    started at all, e.g. because hg is missing or too old, or once it is shut
+    down, it is marked as unavailable and no further commands are tried.
+    """
+
+    command = ['hg', 'serve', '--cmdserver', 'pipe', '--config', 'ui.interactive=False']
+
+    def __init__(self, path, command=None):
+        self.path = path
+        if command is not None:
+            self.command = command
+        self.process = None
+        self.capabilities = set()
+        self.encoding = None
+        self.unavailable = False
+        self._lock = threading.Lock()
+
+    def _read(self, size):
+        """Read exactly size bytes from the server"""
+        data = b''
+        while len(data) < size:
+            chunk = self.process.stdout.read(size - len(data))
+            if not chunk:
+                raise CommandServerError('Unexpected end of stream')
+            data += chunk
+        return data
+
+    def _read_message(self):
+        """Returns the channel and the data of the next message"""
+        channel, length = struct.unpack('>cI', self._read(5))
+        if channel in b'IL':
+            return channel, length
+        return channel, self._read(length)
+
+    def start(self):
+        """Start the server and read its hello message"""
+        env = dict(os.environ, HGPLAIN='1', HGENCODING='UTF-8')
+        with open(os.devnull, mode='w') as fd_devnull:
+            self.process = subprocess.Popen(
+                self.command, cwd=self.path, env=env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=fd_devnull,
+            )
+        channel, data = self._read_message()
+        if channel != b'o':
+            raise CommandServerError('Invalid hello message')
+        for line in data.decode('ascii', 'replace').splitlines():
+            key, _, value = line.partition(': ')
+            if key == 'capabilities':
+                self.capabilities = set(value.split())
+            elif key == 'encoding':
+                self.encoding = value
+        if 'runcommand' not in self.capabilities:
+            raise CommandServerError('Server does not support runcommand')
+
+    def close(self):
+        """Stop the server"""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.stdout.close()
+                self.process.kill()
+                self.process.wait()
+            except (IOError, OSError):
+                pass
+            self.process = None
+
+    def shutdown(self):
+        """Stop the server for good, after the command in progress"""
+        with self._lock:
+            self.unavailable = True
+            self.close()
+
+    def _runcommand(self, args):
+        """Run a command, returns its return code and output"""
+        if self.process is None or self.process.poll() is not None:
+            self.close()
+            try:
+                self.start()
+            except (CommandServerError, IOError, OSError, struct.error):
+                self.unavailable = True
+                raise
+
+        data = b'\0'.join(args)
+        self.process.stdin.write(b'runcommand\n' + struct.pack('>I', len(data)) + data)
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            channel, data = self._read_message()
+            if channel == b'o':
+                output.append(data)
+            elif channel == b'r':
+                return struct.unpack('>i', data)[0], b''.join(output)
+            elif channel in b'IL':
+                # Commands are run non-interactively, answer with EOF
+                self.process.stdin.write(struct.pack('>I', 0))
+                self.process.stdin.flush()
+            elif channel.isupper():
+                raise CommandServerError('Unsupported required channel {0!r}'.format(channel))
+
+    def runcommand(self, args):
+        """
+        Run a command given as a list of bytes, returns its return code and
+        output as bytes
+        """
+        with self._lock:
+            for _ in range(2):
+                if self.unavailable:
+                    raise CommandServerError('Command server unavailable')
+                try:
+                    return self._runcommand(args)
+                except (CommandServerError, IOError, OSError, struct.error):
+                    self.close()
+        raise CommandServerError('Command server failed: {0!r}'.format(args))
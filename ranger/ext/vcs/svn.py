@@ -147,3 +147,6 @@ class SVN(Vcs):
             return log[0]
         else:
             raise VcsError('More than one instance of revision {0:s}'.format(rev))
+
+    def data_outdated_signals(self, root_info=None):  # pylint: disable=unused-argument
+        return [os.path.join(self.repodir, 'wc.db')]
@@ -5,12 +5,19 @@
 
 from __future__ import (absolute_import, division, print_function)
 
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha1
+import json
 import os
 import subprocess
+from sys import version_info
 import threading
 import time
+import zlib
 
 from ranger.ext import spawn
+from .hgcmdserver import CommandServer, CommandServerError
 
 # Python 2 compatibility
 try:
@@ -68,6 +75,18 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
         'unknown',
     )
 
+    # Process-wide cache of root discovery probes, shared by all instances.
+    # Maps paths to {'islink': bool, repotype: bool}, a repotype being True if
+    # the path contains its repodir
+    _root_cache = {}
+    ROOT_CACHE_MAXSIZE = 100000
+
+    # Mercurial command servers by root, the least recently used first. Each
+    # one is a process, so only the most recently used ones are kept running.
+    _cmdservers = OrderedDict()
+    _cmdservers_lock = threading.Lock()
+    CMDSERVERS_MAXSIZE = 8
+
     def __init__(self, dirobj):
         self.obj = dirobj
         self.path = dirobj.path
@@ -113,8 +132,19 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
              catchout=True, retbytes=False, rstrip_newline=True):
         """Run a command"""
         if self.repotype == 'hg':
-            # use "chg", a faster built-in client
-            cmd = ['chg'] + args
+            try:
+                output = self._run_cmdserver(args, path)
+            except CommandServerError:
+                # use "chg", a faster built-in client
+                cmd = ['chg'] + args
+            else:
+                if not catchout:
+                    return None
+                if not retbytes:
+                    output = output.decode(spawn.ENCODING)
+                    if rstrip_newline and output.endswith('\n'):
+                        return output[:-1]
+                return output
         else:
             cmd = [self.repotype] + args
         if path is None:
@@ -133,6 +163,45 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
         except (subprocess.CalledProcessError, OSError):
             raise VcsError('{0:s}: {1:s}'.format(str(cmd), path))
 
+    def _cmdserver(self):
+        """Returns the command server of the root, stopping the least recently used ones"""
+        evicted = []
+        with self._cmdservers_lock:
+            try:
+                cmdserver = self._cmdservers.pop(self.root)
+            except KeyError:
+                cmdserver = CommandServer(self.root)
+            self._cmdservers[self.root] = cmdserver
+            while len(self._cmdservers) > self.CMDSERVERS_MAXSIZE:
+                evicted.append(self._cmdservers.popitem(last=False)[1])
+        for server in evicted:
+            server.shutdown()
+        return cmdserver
+
+    @classmethod
+    def cmdservers_close(cls):
+        """Stop all command servers"""
+        with cls._cmdservers_lock:
+            servers = list(cls._cmdservers.values())
+            cls._cmdservers.clear()
+        for server in servers:
+            server.shutdown()
+
+    def _run_cmdserver(self, args, path=None):
+        """Run a command on the command server of the root, returns its output"""
+        cmdserver = self._cmdserver()
+        if path is None:
+            path = self.path
+        if path != self.root:
+            args = ['--cwd', path] + args
+        if version_info[0] >= 3:
+            args = [arg.encode(spawn.ENCODING, 'surrogateescape') for arg in args]
+
+        returncode, output = cmdserver.runcommand(args)
+        if returncode != 0:
+            raise VcsError('{0:s}: {1:s}'.format(str(args), path))
+        return output
+
     def _get_repotype(self, path):
         """Get type for path"""
         for repotype in self.repotypes_settings:
@@ -141,17 +210,44 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
                 return (repodir, repotype)
         return (None, None)
 
+    def _root_cache_entry(self, path):
+        """Returns the root discovery cache entry of path"""
+        try:
+            return self._root_cache[path]
+        except KeyError:
+            if len(self._root_cache) >= self.ROOT_CACHE_MAXSIZE:
+                self._root_cache.clear()
+            entry = self._root_cache[path] = {'islink': os.path.islink(path)}
+            return entry
+
+    def _get_repotype_cached(self, path):
+        """Get type for path, using the root discovery cache"""
+        entry = self._root_cache_entry(path)
+        for repotype in self.repotypes_settings:
+            try:
+                exists = entry[repotype]
+            except KeyError:
+                exists = entry[repotype] = os.path.exists(os.path.join(path, '.' + repotype))
+            if exists:
+                return (os.path.join(path, '.' + repotype), repotype)
+        return (None, None)
+
+    @classmethod
+    def root_cache_invalidate(cls, path):
+        """Forget the cached root discovery probes of path"""
+        cls._root_cache.pop(path, None)
+
     def _find_root(self, path):
         """Finds root path"""
         links = set()
         while True:
-            if os.path.islink(path):
+            if self._root_cache_entry(path)['islink']:
                 links.add(path)
                 relpath = os.path.relpath(self.path, path)
                 path = os.path.realpath(path)
                 self.path = os.path.normpath(os.path.join(path, relpath))
 
-            repodir, repotype = self._get_repotype(path)
+            repodir, repotype = self._get_repotype_cached(path)
             if repodir:
                 return (path, repodir, repotype, links)
 
@@ -165,9 +261,15 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
     def reinit(self):
         """Reinit"""
         if not self.in_repodir:
-            if not self.track \
-                    or (not self.is_root_pointer and self._get_repotype(self.obj.realpath)[0]) \
-                    or not os.path.exists(self.repodir):
+            if not self.track:
+                self.__init__(self.obj)
+            elif not self.is_root_pointer and self._get_repotype(self.obj.realpath)[0]:
+                # A repository has been created
+                self.root_cache_invalidate(self.obj.realpath)
+                self.__init__(self.obj)
+            elif not os.path.exists(self.repodir):
+                # The repository has been removed
+                self.root_cache_invalidate(self.root)
                 self.__init__(self.obj)
 
     # Action interface
@@ -208,6 +310,33 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
         """Returns info string about revision rev. None in special cases"""
         raise NotImplementedError
 
+    def data_root_info(self):
+        """
+        Returns a dict with the info about HEAD ('head'), the current branch
+        ('branch'), its upstream ('upstream'), the remote status
+        ('remotestatus') and the number of commits ahead and behind the
+        upstream ('ahead', 'behind'), None when unknown
+
+        Backends should override this to query everything at once.
+        """
+        return {
+            'head': self.data_info(self.HEAD),
+            'branch': self.data_branch(),
+            'upstream': None,
+            'remotestatus': self.data_status_remote(),
+            'ahead': None,
+            'behind': None,
+        }
+
+    def data_outdated_signals(self, root_info=None):
+        """
+        Returns paths whose stat changes whenever the repository state changes,
+        e.g. the index and the current head. Used to cheaply check if the root
+        is outdated, so it must not run any command. root_info is the last
+        result of data_root_info(), None if unknown
+        """
+        raise NotImplementedError
+
 
 class VcsRoot(Vcs):  # pylint: disable=abstract-method
     """Vcs root"""
@@ -216,45 +345,192 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
     branch = None
     updatetime = None
     status_subpaths = None
+    status_dirs = None
+    outdated_signature = None
+    cached = False
+    root_info = None
+    root_info_signature = None
 
     def _status_root(self):
         """Returns root status"""
         if self.status_subpaths is None:
             return 'none'
+        return self.status_dirs.get('', 'sync')
 
-        statuses = set(status for path, status in self.status_subpaths.items())
-        for status in self.DIRSTATUSES:
-            if status in statuses:
-                return status
-        return 'sync'
+    def _status_dirs_build(self, status_subpaths):
+        """
+        Build the aggregated status of every directory containing a path in
+        status_subpaths, following the precedence in DIRSTATUSES
 
-    def init_root(self):
-        """Initialize root cheaply"""
+        The result maps directory paths relative to self.root to a status, ''
+        being the root itself. Every parent of a subpath gets an entry, so
+        this is a flattened path trie which answers lookups in O(depth).
+        """
+        precedence = dict((status, i) for i, status in enumerate(self.DIRSTATUSES))
+        ranks = {}
+        for subpath, status in status_subpaths.items():
+            rank = precedence.get(status)
+            if rank is None:
+                continue
+            dirpath = subpath
+            while dirpath:
+                dirpath = os.path.dirname(dirpath)
+                if ranks.get(dirpath, rank + 1) <= rank:
+                    # Parents of dirpath have already been ranked at least as high
+                    break
+                ranks[dirpath] = rank
+        return dict((dirpath, self.DIRSTATUSES[rank]) for dirpath, rank in ranks.items())
+
+    def _outdated_signature(self, root_info):
+        """Returns the stats of the paths signaling repository changes"""
+        signature = []
+        for path in self.data_outdated_signals(root_info):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime))
+        return tuple(signature)
+
+    def query_root(self, full=True):
+        """
+        Query the state of the root from the backend, cheaply unless full is set
+
+        Does not modify the root, so it is safe to run in a worker thread.
+        Returns a dict for apply_root() or the VcsError raised by the backend.
+        """
+        state = {}
         try:
-            self.head = self.data_info(self.HEAD)
-            self.branch = self.data_branch()
-            self.obj.vcsremotestatus = self.data_status_remote()
-            self.obj.vcsstatus = self.data_status_root()
+            # The root info only changes along with the signature
+            signature = self._outdated_signature(self.root_info)
+            if self.root_info is None or self.root_info_signature != signature:
+                info = state['root_info'] = self.data_root_info()
+                # The signals depend on the root info, e.g. on the upstream
+                if self.data_outdated_signals(info) != \
+                        self.data_outdated_signals(self.root_info):
+                    signature = self._outdated_signature(info)
+                state['root_info_signature'] = signature
+            else:
+                info = self.root_info
+            if full:
+                state['outdated_signature'] = signature
+            state['head'] = info['head']
+            state['branch'] = info['branch']
+            state['vcsremotestatus'] = info['remotestatus']
+            if full:
+                state['status_subpaths'] = self.data_status_subpaths()
+                state['status_dirs'] = self._status_dirs_build(state['status_subpaths'])
+            else:
+                state['vcsstatus'] = self.data_status_root()
         except VcsError as ex:
-            self.obj.fm.notify('VCS Exception: View log for more info', bad=True, exception=ex)
+            return ex
+        if full:
+            state['updatetime'] = time.time()
+            self._cache_save(state, info)
+        return state
+
+    def apply_root(self, state):
+        """Apply state returned by query_root()"""
+        if isinstance(state, VcsError):
+            self.obj.fm.notify('VCS Exception: View log for more info', bad=True, exception=state)
             return False
+        for attr in ('outdated_signature', 'root_info', 'root_info_signature', 'head', 'branch',
+                     'updatetime'):
+            if attr in state:
+                setattr(self, attr, state[attr])
+        if 'status_subpaths' in state:
+            self.status_subpaths = state['status_subpaths']
+            self.status_dirs = state['status_dirs']
+        self.obj.vcsremotestatus = state['vcsremotestatus']
+        self.obj.vcsstatus = state['vcsstatus'] if 'vcsstatus' in state \
+            else self._status_root()
         self.rootinit = True
+        self.cached = state.get('cached', False)
         return True
 
+    # Cache of the state across sessions
+
+    def _cache_path(self):
+        """Returns the cache file of the root, None if caching is disabled"""
+        cachedir = self.obj.fm.cachepath('vcs')
+        if cachedir is None:
+            return None
+        if version_info[0] < 3:
+            return os.path.join(cachedir, sha1(self.path).hexdigest())
+        return os.path.join(
+            cachedir, sha1(self.path.encode('utf-8', 'surrogateescape')).hexdigest())
+
+    def _cache_save(self, state, root_info):
+        """
+        Save the state of a full update and its root info, keyed by the
+        outdated signature
+        """
+        path = self._cache_path()
+        if path is None:
+            return
+        head = root_info['head']
+        if head is not None:
+            head = dict(head, date=time.mktime(head['date'].timetuple()))
+        cache = {
+            'root': self.path,
+            'signature': state['outdated_signature'],
+            'root_info': dict(root_info, head=head),
+            'status_subpaths': state['status_subpaths'],
+        }
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path + '.tmp', 'wb') as fobj:
+                fobj.write(zlib.compress(json.dumps(cache).encode('utf-8')))
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError):
+            pass
+
+    def cache_load(self):
+        """
+        Returns the state saved by a previous session for apply_root(), None if
+        there is none or the repository has changed since. The restored root
+        stays outdated so it gets revalidated.
+
+        Does not modify the root, so it is safe to run in a worker thread.
+        """
+        path = self._cache_path()
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as fobj:
+                cache = json.loads(zlib.decompress(fobj.read()).decode('utf-8'))
+            root_info = cache['root_info']
+            # The signals depend on the root info, JSON has no tuples
+            signature = self._outdated_signature(root_info)
+            if cache['root'] != self.path or \
+                    cache['signature'] != json.loads(json.dumps(signature)):
+                return None
+            if root_info['head'] is not None:
+                root_info['head']['date'] = datetime.fromtimestamp(root_info['head']['date'])
+            status_subpaths = cache['status_subpaths']
+            state = {
+                'root_info': root_info,
+                'root_info_signature': signature,
+                'head': root_info['head'],
+                'branch': root_info['branch'],
+                'status_subpaths': status_subpaths,
+                'status_dirs': self._status_dirs_build(status_subpaths),
+                'vcsremotestatus': root_info['remotestatus'],
+                'cached': True,
+            }
+        except (IOError, OSError, ValueError, KeyError, TypeError, zlib.error):
+            return None
+        return state
+
+    def init_root(self):
+        """Initialize root cheaply"""
+        return self.apply_root(self.query_root(full=False))
+
     def update_root(self):
         """Update root state"""
-        try:
-            self.head = self.data_info(self.HEAD)
-            self.branch = self.data_branch()
-            self.status_subpaths = self.data_status_subpaths()
-            self.obj.vcsremotestatus = self.data_status_remote()
-            self.obj.vcsstatus = self._status_root()
-        except VcsError as ex:
-            self.obj.fm.notify('VCS Exception: View log for more info', bad=True, exception=ex)
-            return False
-        self.rootinit = True
-        self.updatetime = time.time()
-        return True
+        return self.apply_root(self.query_root(full=True))
 
     def _update_walk(self, path, purge):  # pylint: disable=too-many-branches
         """Update walk"""
@@ -326,23 +602,31 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
             self.__init__(self.obj)
 
     def check_outdated(self):
-        """Check if root is outdated"""
+        """
+        Check if root is outdated
+
+        Only looks at the repository's own state and at directories which are
+        already loaded, no directory objects are created.
+        """
         if self.updatetime is None:
             return True
+        if self._outdated_signature(self.root_info) != self.outdated_signature:
+            return True
 
-        for wroot, wdirs, _ in os.walk(self.path):
-            wrootobj = self.obj.fm.get_directory(wroot)
-            wrootobj.load_if_outdated()
-            if wroot != self.path and wrootobj.vcs.is_root_pointer:
-                wdirs[:] = []
+        prefixes = tuple(path.rstrip('/') + '/' for path in [self.path] + list(self.links))
+        for path, dirobj in list(self.obj.fm.directories.items()):
+            if not dirobj.content_loaded:
                 continue
+            if path != self.path and path not in self.links:
+                if not path.startswith(prefixes) or not dirobj.vcs or not dirobj.vcs.track \
+                        or dirobj.vcs.rootvcs is not self:
+                    continue
 
-            if wrootobj.stat and self.updatetime < wrootobj.stat.st_mtime:
+            try:
+                if self.updatetime < os.stat(path).st_mtime:
+                    return True
+            except OSError:
                 return True
-            if wrootobj.files_all:
-                for wfile in wrootobj.files_all:
-                    if wfile.stat and self.updatetime < wfile.stat.st_mtime:
-                        return True
         return False
 
     def status_subpath(self, path, is_directory=False):
@@ -364,17 +648,23 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
             tmppath = os.path.dirname(tmppath)
 
         # check if path contains some file in status
-        if is_directory:
-            statuses = set(status for subpath, status in self.status_subpaths.items()
-                           if subpath.startswith(relpath + '/'))
-            for status in self.DIRSTATUSES:
-                if status in statuses:
-                    return status
+        if is_directory and relpath != '.':
+            return self.status_dirs.get(relpath, 'sync')
         return 'sync'
 
 
 class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attributes
-    """VCS thread"""
+    """
+    VCS thread
+
+    Decides which roots need to be initialized or updated, queries them on a
+    pool of worker threads and applies the results in batches between redraws.
+    """
+
+    # Number of roots queried concurrently
+    WORKERS = 4
+    # Seconds to wait for more results before applying a batch
+    BATCH_DELAY = 0.05
 
     def __init__(self, ui):
         super(VcsThread, self).__init__()
@@ -389,6 +679,10 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
         self._awoken = threading.Event()
         self._redraw = False
         self._roots = set()
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._workers = []
+        self._links = {}
 
     def _is_targeted(self, dirobj):
         """Check if dirobj is targeted"""
@@ -396,7 +690,33 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
             return True
         return False
 
-    def _update_subroots(self, fsobjs):
+    def _visible_paths(self):
+        """Returns the paths currently shown in the columns"""
+        paths = set()
+        for column in self._ui.browser.columns:
+            target = column.target
+            if not target or not target.is_directory:
+                continue
+            paths.add(target.path)
+            if target.files:
+                begin = column.scroll_begin
+                paths.update(fsobj.path for fsobj in target.files[begin:begin + column.hei])
+        return paths
+
+    def _worker(self):
+        """Worker thread querying roots"""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            _, rootvcs, full = job
+            try:
+                state = rootvcs.query_root(full=full)
+            except Exception as ex:  # pylint: disable=broad-except
+                state = VcsError(str(ex))
+            self._results.put((rootvcs, full, state))
+
+    def _update_subroots(self, fsobjs, jobs):
         """Update subroots"""
         if not fsobjs:
             return False
@@ -409,23 +729,91 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
             rootvcs = fsobj.vcs.rootvcs
             if fsobj.vcs.is_root_pointer:
                 has_vcschild = True
-                if not rootvcs.rootinit and not self._is_targeted(rootvcs.obj):
+                if (not rootvcs.rootinit or rootvcs.cached) \
+                        and not self._is_targeted(rootvcs.obj) \
+                        and rootvcs.path not in self._roots:
                     self._roots.add(rootvcs.path)
-                    if not rootvcs.init_root():
-                        rootvcs.update_tree(purge=True)
-                    self._redraw = True
+                    jobs.append((fsobj.path, rootvcs, False))
                 if fsobj.is_link:
-                    fsobj.vcsstatus = rootvcs.obj.vcsstatus
-                    fsobj.vcsremotestatus = rootvcs.obj.vcsremotestatus
-                    self._redraw = True
+                    if rootvcs.path in self._roots:
+                        self._links.setdefault(rootvcs.path, []).append(fsobj)
+                    else:
+                        fsobj.vcsstatus = rootvcs.obj.vcsstatus
+                        fsobj.vcsremotestatus = rootvcs.obj.vcsremotestatus
+                        self._redraw = True
 
         return has_vcschild
 
-    def _queue_process(self):  # pylint: disable=too-many-branches
+    def _apply_results(self, results):
+        """Apply a batch of query results"""
+        for rootvcs, full, state in results:
+            if rootvcs.apply_root(state):
+                if full:
+                    rootvcs.update_tree()
+            else:
+                rootvcs.update_tree(purge=True)
+            for fsobj in self._links.pop(rootvcs.path, ()):
+                fsobj.vcsstatus = rootvcs.obj.vcsstatus
+                fsobj.vcsremotestatus = rootvcs.obj.vcsremotestatus
+        self._redraw = True
+
+    def _apply_batch(self, results):
+        """Apply results between redraws"""
+        self._ui.redrawlock.wait()
+        self._ui.redrawlock.clear()
+        try:
+            self._apply_results(results)
+        finally:
+            self._ui.redrawlock.set()
+        self._redraw_ui()
+
+    def _process_jobs(self, jobs):
+        """Query roots on the workers and apply the results in batches"""
+        visible = self._visible_paths()
+        # Stable sort, visible roots first
+        jobs.sort(key=lambda job: job[0] not in visible)
+
+        # Show the state of new roots saved by previous sessions until their
+        # queries are done
+        restored = []
+        for _, rootvcs, _ in jobs:
+            if not rootvcs.rootinit:
+                state = rootvcs.cache_load()
+                if state is not None:
+                    restored.append((rootvcs, True, state))
+        if restored:
+            self._apply_batch(restored)
+
+        while len(self._workers) < min(self.WORKERS, len(jobs)):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        for job in jobs:
+            self._jobs.put(job)
+
+        pending = len(jobs)
+        while pending > 0:
+            results = [self._results.get()]
+            deadline = time.time() + self.BATCH_DELAY
+            while len(results) < pending:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    results.append(self._results.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            pending -= len(results)
+            self._apply_batch(results)
+
+    def _queue_process(self):
         """Process queue"""
         dirobjs = []
         paths = set()
+        jobs = []
         self._roots.clear()
+        self._links.clear()
 
         while True:
             try:
@@ -443,24 +831,35 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
                 rootvcs = dirobj.vcs.rootvcs
                 if rootvcs.path not in self._roots and rootvcs.check_outdated():
                     self._roots.add(rootvcs.path)
-                    if rootvcs.update_root():
-                        rootvcs.update_tree()
-                    else:
-                        rootvcs.update_tree(purge=True)
-                    self._redraw = True
+                    jobs.append((dirobj.path, rootvcs, True))
 
-            has_vcschild = self._update_subroots(dirobj.files_all)
+            has_vcschild = self._update_subroots(dirobj.files_all, jobs)
 
             if dirobj.has_vcschild != has_vcschild:
                 dirobj.has_vcschild = has_vcschild
                 self._redraw = True
 
+        if jobs:
+            self._process_jobs(jobs)
+
+    def _redraw_ui(self):
+        """Redraw the columns and the status bar if needed"""
+        if self._redraw:
+            self._redraw = False
+            for column in self._ui.browser.columns:
+                if column.target and column.target.is_directory:
+                    column.need_redraw = True
+            self._ui.status.need_redraw = True
+            self._ui.redraw()
+
     def run(self):
         while True:
             self.paused.set()
             self._advance.wait()
             self._awoken.wait()
             if self.__stop.isSet():
+                for _ in self._workers:
+                    self._jobs.put(None)
                 self.stopped.set()
                 return
             if not self._advance.isSet():
@@ -470,14 +869,7 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
 
             try:
                 self._queue_process()
-
-                if self._redraw:
-                    self._redraw = False
-                    for column in self._ui.browser.columns:
-                        if column.target and column.target.is_directory:
-                            column.need_redraw = True
-                    self._ui.status.need_redraw = True
-                    self._ui.redraw()
+                self._redraw_ui()
             except Exception as ex:  # pylint: disable=broad-except
                 self._ui.fm.notify('VCS Exception: View log for more info', bad=True, exception=ex)
 
@@ -4,28 +4,118 @@
 
 from __future__ import (absolute_import, division, print_function)
 
+import re
 import sys
+from bisect import bisect_right
 from unicodedata import east_asian_width
 
+try:
+    from itertools import accumulate
+except ImportError:  # Python 2, see _width_slice_py2
+    accumulate = None  # pylint: disable=invalid-name
+
 PY3 = sys.version_info[0] >= 3
 ASCIIONLY = set(chr(c) for c in range(1, 128))
 NARROW = 1
 WIDE = 2
 WIDE_SYMBOLS = set('WF')
+# The number of string widths to remember
+WIDTH_CACHE_MAX = 4096
+
+try:
+    _isascii = str.isascii  # pylint: disable=invalid-name
+except AttributeError:  # Python < 3.7
+    _NON_ASCII = re.compile('[^\x00-\x7f]')
+
+    def _isascii(string):
+        return not _NON_ASCII.search(string)
+
+
+class _CharWidths(dict):
+    """The widths of the characters looked up so far"""
+
+    def __missing__(self, char):
+        width = WIDE if east_asian_width(char) in WIDE_SYMBOLS else NARROW
+        self[char] = width
+        return width
+
+
+_CHAR_WIDTHS = _CharWidths()
+_WIDTHS = {}
 
 
 def uwid(string):
-    """Return the width of a string"""
+    """Return the width of a string
+
+    >>> uwid("poo"), uwid(u"モヒカン"), uwid(u"aモ…")
+    (3, 8, 4)
+    """
     if not PY3:
         string = string.decode('utf-8', 'ignore')
-    return sum(utf_char_width(c) for c in string)
+    if _isascii(string):
+        return len(string)
+    try:
+        return _WIDTHS[string]
+    except KeyError:
+        pass
+    width = sum(map(_CHAR_WIDTHS.__getitem__, string))
+    if len(_WIDTHS) >= WIDTH_CACHE_MAX:
+        _WIDTHS.clear()
+    _WIDTHS[string] = width
+    return width
 
 
 def utf_char_width(string):
     """Return the width of a single character"""
-    if east_asian_width(string) in WIDE_SYMBOLS:
-        return WIDE
-    return NARROW
+    return _CHAR_WIDTHS[string]
+
+
+def width_slice(string, start, stop):
+    """Cut the string to the columns from start to stop
+
+    Wide characters which are cut in half are replaced by a space.
+
+    >>> width_slice(u"モabカン", 1, 5) == u" ab "
+    True
+    >>> width_slice(u"モヒカン", 1, 2) == u" "
+    True
+    """
+    if start >= stop:
+        return string[:0]
+    if not PY3:
+        return _width_slice_py2(string.decode('utf-8', 'ignore'), start, stop).encode('utf-8')
+    if _isascii(string):
+        return string[start:stop]
+    # ends[i] is the column after the character i, which are at least one
+    # column wide, so the ones after stop don't matter
+    ends = list(accumulate(map(_CHAR_WIDTHS.__getitem__, string[:stop + 1])))
+    if ends[-1] == len(ends):
+        # no wide characters
+        return string[start:stop]
+    first = bisect_right(ends, start)
+    last = bisect_right(ends, stop)
+    prefix = suffix = ''
+    if first < len(ends) and ends[first] == start + 1 and _CHAR_WIDTHS[string[first]] == WIDE:
+        prefix = ' '
+        first += 1
+    if last < len(ends) and ends[last] == stop + 1 and _CHAR_WIDTHS[string[last]] == WIDE:
+        suffix = ' '
+    return prefix + string[first:last] + suffix
+
+
+def _width_slice_py2(string, start, stop):
+    result = []
+    pos = 0
+    for char in string:
+        if pos >= stop:
+            break
+        end = pos + _CHAR_WIDTHS[char]
+        if pos >= start:
+            result.append(char if end <= stop else u' ')
+        elif end > start:
+            result.append(u' ')
+        pos = end
+    return u''.join(result)
 
 
 def string_to_charlist(string):
@@ -36,7 +126,7 @@ def string_to_charlist(string):
     if PY3:
         for char in string:
             result.append(char)
-            if east_asian_width(char) in WIDE_SYMBOLS:
+            if _CHAR_WIDTHS[char] == WIDE:
                 result.append('')
     else:
         try:
@@ -49,7 +139,7 @@ def string_to_charlist(string):
             return []
         for char in string:
             result.append(char.encode('utf-8'))
-            if east_asian_width(char) in WIDE_SYMBOLS:
+            if _CHAR_WIDTHS[char] == WIDE:
                 result.append('')
     return result
 
@@ -63,10 +153,15 @@ class WideString(object):  # pylint: disable=too-few-public-methods
             # Here I assume that string is a "unicode" object, because why else
             # would str(string) raise a UnicodeEncodeError?
             self.string = string.encode('latin-1', 'ignore')
-        if chars is None:
-            self.chars = string_to_charlist(string)
-        else:
-            self.chars = chars
+        # The list of characters is only made when it is used, the width
+        # and slices are computed without it
+        self._chars = chars
+
+    @property
+    def chars(self):
+        if self._chars is None:
+            self._chars = string_to_charlist(self.string)
+        return self._chars
 
     def __add__(self, string):
         """
@@ -80,7 +175,7 @@ class WideString(object):  # pylint: disable=too-few-public-methods
         if isinstance(string, str):
             return WideString(self.string + string)
         elif isinstance(string, WideString):
-            return WideString(self.string + string.string, self.chars + string.chars)
+            return WideString(self.string + string.string)
         return None
 
     def __radd__(self, string):
@@ -91,7 +186,7 @@ class WideString(object):  # pylint: disable=too-few-public-methods
         if isinstance(string, str):
             return WideString(string + self.string)
         elif isinstance(string, WideString):
-            return WideString(string.string + self.string, string.chars + self.chars)
+            return WideString(string.string + self.string)
         return None
 
     def __str__(self):
@@ -123,21 +218,16 @@ class WideString(object):  # pylint: disable=too-few-public-methods
         >>> WideString("aモ")[0:1]
         <WideString 'a'>
         """
-        if stop is None or stop > len(self.chars):
-            stop = len(self.chars)
+        width = len(self)
+        if stop is None or stop > width:
+            stop = width
         if stop < 0:
-            stop = len(self.chars) + stop
+            stop = width + stop
         if stop < 0:
             return WideString("")
         if start is None or start < 0:
             start = 0
-        if stop < len(self.chars) and self.chars[stop] == '':
-            if self.chars[start] == '':
-                return WideString(' ' + ''.join(self.chars[start:stop - 1]) + ' ')
-            return WideString(''.join(self.chars[start:stop - 1]) + ' ')
-        if self.chars[start] == '':
-            return WideString(' ' + ''.join(self.chars[start:stop - 1]))
-        return WideString(''.join(self.chars[start:stop]))
+        return WideString(width_slice(self.string, start, stop))
 
     def __getitem__(self, i):
         """
@@ -159,7 +249,7 @@ class WideString(object):  # pylint: disable=too-few-public-methods
         >>> len(WideString("モヒカン"))
         8
         """
-        return len(self.chars)
+        return uwid(self.string)
 
 
 if __name__ == '__main__':
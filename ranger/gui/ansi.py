@@ -8,7 +8,7 @@ from __future__ import (absolute_import, division, print_function)
 
 import re
 
-from ranger.ext.widestring import WideString
+from ranger.ext.widestring import WideString, uwid, width_slice
 from ranger.gui import color
 
 
@@ -105,6 +105,57 @@ def text_with_fg_bg_attr(ansi_text):  # pylint: disable=too-many-branches,too-ma
             yield chunk
 
 
+def tokenize(ansi_text):
+    """Split the text into runs of (text, fg, bg, attr, width)
+
+    The width is the number of columns the text takes.  The runs of a line
+    can be kept and cut with slice_runs(), instead of parsing the codes again
+    on every redraw.
+
+    >>> tokenize("ab\x1b[31mc\x1b[0m")
+    [('ab', -1, -1, 0, 2), ('c', 1, -1, 0, 1)]
+    >>> tokenize("")
+    []
+    """
+    runs = []
+    fg, bg, attr = -1, -1, 0
+    for chunk in text_with_fg_bg_attr(ansi_text):
+        if isinstance(chunk, tuple):
+            fg, bg, attr = chunk
+        elif chunk:
+            runs.append((chunk, fg, bg, attr, uwid(chunk)))
+    return runs
+
+
+def slice_runs(runs, start, length):
+    """Cut runs of tokenize() to the columns from start to start + length
+
+    >>> runs = tokenize("abcde\x1b[30mfoo\x1b[31mbar\x1b[0mnormal")
+    >>> [run[0] for run in slice_runs(runs, 4, 5)]
+    ['e', 'foo', 'b']
+    >>> slice_runs(runs, 9, 4)
+    [('ar', 1, -1, 0, 2), ('no', -1, -1, 0, 2)]
+    >>> slice_runs(runs, 20, 4)
+    []
+    """
+    result = []
+    end = start + length
+    pos = 0
+    for run in runs:
+        text, fg, bg, attr, width = run
+        old_pos = pos
+        pos += width
+        if pos <= start:
+            continue
+        if old_pos >= end:
+            break
+        if old_pos < start or pos > end:
+            cut = width_slice(text, max(0, start - old_pos), end - old_pos)
+            run = (cut, fg, bg, attr, uwid(cut))
+        result.append(run)
+    return result
+
+
 def char_len(ansi_text):
     """Count the number of visible characters.
 
@@ -119,7 +170,7 @@ def char_len(ansi_text):
     >>> char_len("")
     0
     """
-    return len(WideString(ansi_re.sub('', ansi_text)))
+    return uwid(ansi_re.sub('', ansi_text))
 
 
 def char_slice(ansi_text, start, length):
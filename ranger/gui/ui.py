@@ -350,6 +350,8 @@ class UI(  # pylint: disable=too-many-instance-attributes,too-many-public-method
     def update_size(self):
         """resize all widgets"""
         self.termsize = self.win.getmaxyx()
+        if self.fm.image_displayer is not None:
+            self.fm.image_displayer.terminal_resized()
         y, x = self.termsize
 
         self.browser.resize(self.settings.status_bar_on_top and 2 or 1, 0, y - 2, x)
@@ -400,6 +402,16 @@ class UI(  # pylint: disable=too-many-instance-attributes,too-many-public-method
                 self.browser.pager.draw_image()
             else:
                 self.browser.columns[-1].draw_image()
+        if self.fm.image_displayer is None:
+            return
+        try:
+            deferred = self.fm.image_displayer.flush()
+        except Exception as ex:  # pylint: disable=broad-except
+            self.fm.notify(ex, bad=True)
+        else:
+            if deferred:
+                # don't wait for key presses while a drawing is deferred
+                self.set_load_mode(True)
 
     def close_pager(self):
         if self.console.visible:
@@ -7,6 +7,7 @@ from __future__ import (absolute_import, division, print_function)
 
 import curses
 import stat
+from itertools import count
 from time import time
 from os.path import splitext
 
@@ -16,7 +17,7 @@ try:
 except ImportError:
     HAVE_BIDI = False
 
-from ranger.ext.widestring import WideString
+from ranger.ext.widestring import uwid, width_slice
 from ranger.core import linemode
 
 from . import Widget
@@ -27,6 +28,10 @@ def hook_before_drawing(fsobject, color_list):
     return fsobject, color_list
 
 
+# Numbers the render generations of all columns
+_RENDER_GENERATIONS = count(1)
+
+
 class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
     main_column = False
     display_infostring = False
@@ -38,6 +43,18 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
     old_dir = None
     old_thisfile = None
 
+    # The (text, attr) runs of each row on the screen, or None if unknown,
+    # and the (directory, scroll_begin) they were drawn for
+    rows = None
+    rows_origin = None
+
+    # The display data of the files is cached per render generation, which
+    # changes along with anything all rows depend on, see _render_generation
+    render_generation = 0
+    render_state = None
+    render_cache_max = 8
+    copied = frozenset()
+
     def __init__(self, win, level, tab=None):
         """Initializes a Browser Column Widget
 
@@ -56,6 +73,10 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
 
         self.settings.signal_bind('setopt.display_size_in_main_column',
                                   self.request_redraw, weak=True)
+        self.settings.signal_bind('setopt', self._reset_render_state, weak=True)
+
+    def _reset_render_state(self):
+        self.render_state = None
 
     def request_redraw(self):
         self.need_redraw = True
@@ -120,6 +141,54 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
             text, attr = entry
             self.addstr(text, attr)
 
+    def resize(self, y, x, hei=None, wid=None):
+        Widget.resize(self, y, x, hei, wid)
+        self.rows = None
+
+    def _erase(self):
+        self.win.erase()
+        self.rows = None
+
+    def _scroll_rows(self, amount):
+        """Scroll the rows on the screen up by amount, or down if negative"""
+        if not amount or abs(amount) >= self.hei:
+            return
+        try:
+            self.win.move(0, 0)
+            self.win.insdelln(-amount)
+        except curses.error:
+            self.rows = None
+            return
+        if amount > 0:
+            self.rows = self.rows[amount:] + [()] * amount
+        else:
+            self.rows = [()] * -amount + self.rows[:amount]
+
+    def _draw_row(self, line, display_data):
+        """Draw the row unless it is on the screen already"""
+        row = tuple(tuple(entry) for entry in display_data)
+        if self.rows[line] != row:
+            self.rows[line] = row
+            self.execute_curses_batch(line, display_data)
+            self.color_reset()
+
+    def _render_generation(self, *state):
+        """Returns the render generation, a new one if the state changed
+
+        The state is compared to the version counters of the copy buffer,
+        the tags and the metadata, so changes to them are noticed without
+        looking at every file.
+        """
+        fm = self.fm
+        state += (self.wid, self.main_column, self.target.has_vcschild,
+                  fm.do_cut, fm.copy_buffer_version, id(fm.copy_buffer), len(fm.copy_buffer),
+                  id(fm.tags), getattr(fm.tags, 'version', 0), fm.metadata.version)
+        if state != self.render_state:
+            self.render_state = state
+            self.render_generation = next(_RENDER_GENERATIONS)
+            self.copied = frozenset(fobj.path for fobj in fm.copy_buffer)
+        return self.render_generation
+
     def has_preview(self):
         if self.target is None:
             return False
@@ -141,6 +210,8 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
         self.level = self.original_level
 
     def poke(self):
+        if self._old_visible != self.visible:
+            self.rows = None
         Widget.poke(self)
         if self.tab is None:
             tab = self.fm.thistab
@@ -174,15 +245,18 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
                 self.need_redraw |= self.last_redraw_time < target.last_load_time
 
         if self.need_redraw:
-            self.win.erase()
-            if target is None:
-                pass
-            elif target.is_file:
-                Pager.open(self)
-                self._draw_file()
-            elif target.is_directory:
+            if self.parent is not None and self.parent.need_redraw:
+                # The parent may have erased or drawn over its window
+                self.rows = None
+            if target is not None and not target.is_file and target.is_directory:
+                # Only the rows which changed are drawn again
                 self._draw_directory()
                 Widget.draw(self)
+            else:
+                self._erase()
+                if target is not None and target.is_file:
+                    Pager.open(self)
+                    self._draw_file()
             self.need_redraw = False
             self.last_redraw_time = time()
 
@@ -198,6 +272,7 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
             Pager.close(self)
             return
 
+        self.fm.preview_prefetcher.size = (self.wid, self.hei)
         path = self.target.get_preview_source(self.wid, self.hei)
         if path is None:
             Pager.close(self)
@@ -231,6 +306,7 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
             Pager.clear_image(self)
 
         if self.level > 0 and not self.settings.preview_directories:
+            self._erase()
             return
 
         base_color = ['in_browser']
@@ -244,9 +320,9 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
         else:
             active_pane = False
 
-        self.win.move(0, 0)
-
         if not self.target.content_loaded:
+            self._erase()
+            self.win.move(0, 0)
             self.color(tuple(base_color))
             self.addnstr("...", self.wid)
             self.color_reset()
@@ -256,20 +332,28 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
             base_color.append('main_column')
 
         if not self.target.accessible:
+            self._erase()
+            self.win.move(0, 0)
             self.color(tuple(base_color + ['error']))
             self.addnstr("not accessible", self.wid)
             self.color_reset()
             return
 
         if self.target.empty():
+            self._erase()
+            self.win.move(0, 0)
             self.color(tuple(base_color + ['empty']))
             self.addnstr("empty", self.wid)
             self.color_reset()
             return
 
         self._set_scroll_begin()
-
-        copied = [f.path for f in self.fm.copy_buffer]
+        if self.rows is None or len(self.rows) != self.hei:
+            self.win.erase()
+            self.rows = [()] * self.hei
+        elif self.rows_origin is not None and self.rows_origin[0] is self.target:
+            self._scroll_rows(self.scroll_begin - self.rows_origin[1])
+        self.rows_origin = (self.target, self.scroll_begin)
 
         # Set the size of the linum text field to the number of digits in the
         # visible files in directory.
@@ -278,14 +362,35 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
         # add separator between line number and tag
         linum_format += " "
 
+        generation = self._render_generation(active_pane, linum_text_len)
+        copied = self.copied
+
         selected_i = self._get_index_of_selected_file()
-        for line in range(self.hei):
+        end = max(0, min(self.hei, len(self.target.files) - self.scroll_begin))
+        for line in range(end, self.hei):
+            if self.rows[line]:
+                self.rows[line] = ()
+                self.win.move(line, 0)
+                self.win.clrtoeol()
+        for line in range(end):
             i = line + self.scroll_begin
+            drawn = self.target.files[i]
 
-            try:
-                drawn = self.target.files[i]
-            except IndexError:
-                break
+            key = (generation, selected_i == i, drawn.marked, drawn.linemode,
+                   drawn.infostring, drawn.vcsstatus, drawn.vcsremotestatus)
+
+            # Check if current line has not already computed and cached
+            display_data = drawn.display_data.get(key)
+            if display_data is not None:
+                # Recompute line numbers because they can't be reliably cached.
+                if self.main_column and self.settings.line_numbers != 'false':
+                    line_number_text = self._format_line_number(linum_format,
+                                                                i,
+                                                                selected_i)
+                    display_data[0][0] = line_number_text
+
+                self._draw_row(line, display_data)
+                continue
 
             tagged = self.fm.tags and drawn.realpath in self.fm.tags
             if tagged:
@@ -302,26 +407,6 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
                            for tag in current_linemode.required_metadata):
                     current_linemode = drawn.linemode_dict[linemode.DEFAULT_LINEMODE]
 
-            metakey = hash(repr(sorted(metadata.items()))) if metadata else 0
-            key = (self.wid, selected_i == i, drawn.marked, self.main_column,
-                   drawn.path in copied, tagged_marker, drawn.infostring,
-                   drawn.vcsstatus, drawn.vcsremotestatus, self.target.has_vcschild,
-                   self.fm.do_cut, current_linemode.name, metakey, active_pane,
-                   self.settings.line_numbers)
-
-            # Check if current line has not already computed and cached
-            if key in drawn.display_data:
-                # Recompute line numbers because they can't be reliably cached.
-                if self.main_column and self.settings.line_numbers != 'false':
-                    line_number_text = self._format_line_number(linum_format,
-                                                                i,
-                                                                selected_i)
-                    drawn.display_data[key][0][0] = line_number_text
-
-                self.execute_curses_batch(line, drawn.display_data[key])
-                self.color_reset()
-                continue
-
             text = current_linemode.filetitle(drawn, metadata)
 
             if drawn.marked and (self.main_column
@@ -395,6 +480,8 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
             this_color = base_color + list(drawn.mimetype_tuple) + \
                 self._draw_directory_color(i, drawn, copied)
             display_data = []
+            if len(drawn.display_data) >= self.render_cache_max:
+                drawn.display_data.clear()
             drawn.display_data[key] = display_data
 
             drawn, this_color = hook_before_drawing(drawn, this_color)
@@ -404,8 +491,7 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
                 attr = self.settings.colorscheme.get_attr(*(this_color + color))
                 display_data.append([txt, attr])
 
-            self.execute_curses_batch(line, display_data)
-            self.color_reset()
+            self._draw_row(line, display_data)
 
     def _get_index_of_selected_file(self):
         if self.fm.ui.viewmode == 'multipane' and self.tab:
@@ -414,7 +500,7 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
 
     @staticmethod
     def _total_len(predisplay):
-        return sum([len(WideString(s)) for s, _ in predisplay])
+        return sum(uwid(s) for s, _ in predisplay)
 
     def _bidi_transpose(self, text):
         if self.settings.bidi_support and HAVE_BIDI:
@@ -423,16 +509,19 @@ class BrowserColumn(Pager):  # pylint: disable=too-many-instance-attributes
 
     def _draw_text_display(self, text, space):
         bidi_text = self._bidi_transpose(text)
-        wtext = WideString(bidi_text)
-        wext = WideString(splitext(bidi_text)[1])
-        wellip = WideString(self.ellipsis[self.settings.unicode_ellipsis])
-        if len(wtext) > space:
-            wtext = wtext[:max(1, space - len(wext) - len(wellip))] + wellip + wext
-        # Truncate again if still too long.
-        if len(wtext) > space:
-            wtext = wtext[:max(0, space - len(wellip))] + wellip
-
-        return [[str(wtext), []]]
+        if uwid(bidi_text) > space:
+            ext = splitext(bidi_text)[1]
+            ellipsis = self.ellipsis[self.settings.unicode_ellipsis]
+            ellipsis_width = uwid(ellipsis)
+            width = space - uwid(ext) - ellipsis_width
+            if width >= 1:
+                bidi_text = width_slice(bidi_text, 0, width) + ellipsis + ext
+            else:
+                # Truncate again if the extension is too long.
+                bidi_text = width_slice(width_slice(bidi_text, 0, 1) + ellipsis + ext,
+                                        0, max(0, space - ellipsis_width)) + ellipsis
+
+        return [[bidi_text, []]]
 
     def _draw_tagged_display(self, tagged, tagged_marker):
         tagged_display = []
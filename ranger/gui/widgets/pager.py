@@ -7,9 +7,13 @@ from __future__ import (absolute_import, division, print_function)
 
 import curses
 import logging
+import re
 
+from ranger.core.loader import Loadable
 from ranger.gui import ansi
 from ranger.ext.direction import Direction
+from ranger.ext.mapped_file import MappedFile
+from ranger.ext.widestring import uwid
 from ranger.ext.img_display import ImgDisplayUnsupportedException
 
 from . import Widget
@@ -29,6 +33,13 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     need_clear_image = False
     need_redraw_image = False
     max_width = None
+    # The regular expression searched last, the line it was found in and
+    # the Loadable searching, see search()
+    search_regex = None
+    search_line = None
+    search_loader = None
+    # The number of lines to keep tokenized, see _get_runs()
+    runs_cache_max = 4096
 
     def __init__(self, win, embedded=False):
         Widget.__init__(self, win)
@@ -37,11 +48,13 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         self.startx = 0
         self.markup = None
         self.lines = []
+        # Maps line numbers to their runs of ansi.tokenize()
+        self.runs = {}
         self.image = None
         self.image_drawn = False
 
     def _close_source(self):
-        if self.source and self.source_is_stream:
+        if self.source and (self.source_is_stream or isinstance(self.source, MappedFile)):
             try:
                 self.source.close()
             except OSError as ex:
@@ -65,6 +78,7 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         if self.image:
             self.need_clear_image = True
             self.clear_image()
+        self.cancel_search()
         self._close_source()
 
     def destroy(self):
@@ -99,6 +113,8 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
 
                 for line, i in zip(line_gen, range(self.hei)):
                     self._draw_line(i, line)
+                    if self.search_regex is not None:
+                        self._highlight_matches(i, line)
 
             self.need_redraw = False
 
@@ -126,11 +142,93 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
             except curses.error:
                 pass
             else:
-                for chunk in ansi.text_with_fg_bg_attr(line):
-                    if isinstance(chunk, tuple):
-                        self.set_fg_bg_attr(*chunk)
-                    else:
-                        self.addstr(chunk)
+                for text, fg, bg, attr, _ in line:
+                    self.set_fg_bg_attr(fg, bg, attr)
+                    self.addstr(text)
+                self.set_fg_bg_attr(-1, -1, 0)
+
+    def _highlight_matches(self, i, line):
+        text = line if self.markup is None else ''.join(run[0] for run in line)
+        for match in self.search_regex.finditer(text):
+            if match.end() > match.start():
+                self.color_at(i, uwid(text[:match.start()]), uwid(match.group()),
+                              'in_pager', 'text', 'highlight')
+
+    def search(self, regex, forward=True):
+        """Search for the regular expression, starting at the top line
+
+        The search runs as a Loadable of fm.loader and scrolls the matching
+        line into view once found.
+        """
+        self.search_regex = regex
+        self.search_line = None
+        self.need_redraw = True
+        self._start_search(self.scroll_begin, forward)
+
+    def search_next(self, forward=True):
+        """Search for the next or previous match of the last search"""
+        if self.search_regex is None:
+            return False
+        start = self.scroll_begin
+        if self.search_line is not None \
+                and self.scroll_begin <= self.search_line < self.scroll_begin + self.hei:
+            start = self.search_line + 1 if forward else self.search_line
+        self._start_search(start, forward)
+        return True
+
+    def cancel_search(self):
+        if self.search_loader is not None:
+            self.fm.loader.remove(self.search_loader)
+            self.search_loader = None
+
+    def _start_search(self, start, forward):
+        self.cancel_search()
+        if not self.source or self.image:
+            return
+        self.search_loader = Loadable(self._search(self.search_regex, start, forward),
+                                      'Searching for "{0}"'.format(self.search_regex.pattern))
+        self.fm.loader.add(self.search_loader)
+
+    def _search(self, regex, start, forward):
+        lines = self.lines
+        if isinstance(lines, MappedFile):
+            try:
+                # the lines are matched in chunks of the file
+                pattern = re.compile(regex.pattern.encode(lines.encoding),
+                                     regex.flags & ~re.UNICODE  # pylint: disable=no-member
+                                     | re.MULTILINE)
+            except (re.error, UnicodeError):
+                pattern = None
+            if pattern is not None:
+                for line in lines.search(pattern, start, backward=not forward):
+                    if line is not None:
+                        self._found(line)
+                        return
+                    yield
+                self.fm.notify('Pattern not found: {0}'.format(regex.pattern))
+                self.search_loader = None
+                return
+
+        i = start if forward else start - 1
+        while i >= 0:
+            line = self._get_line(i)
+            if i >= len(self.lines):
+                break
+            if regex.search(ansi.ansi_re.sub('', line)):
+                self._found(i)
+                return
+            i += 1 if forward else -1
+            if i % 1000 == 0:
+                yield
+        self.fm.notify('Pattern not found: {0}'.format(regex.pattern))
+        self.search_loader = None
+
+    def _found(self, line):
+        self.search_line = line
+        self.search_loader = None
+        if not self.scroll_begin <= line < self.scroll_begin + self.hei:
+            self.move(to=line)
+        self.need_redraw = True
 
     def move(self, narg=None, **kw):
         direction = Direction(kw)
@@ -169,6 +267,9 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     def set_image(self, image):
         if self.image:
             self.need_clear_image = True
+        self.cancel_search()
+        self.search_line = None
+        self.runs = {}
         self.image = image
         self._close_source()
         self.source = None
@@ -178,10 +279,24 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         if self.image:
             self.image = None
             self.need_clear_image = True
+        elif isinstance(source, MappedFile) and source.same_file(self.source):
+            # keep the index built so far
+            source.close()
+            self.markup = 'ansi'
+            return True
+        self.cancel_search()
+        self.search_line = None
+        if source is not self.source:
+            # the same preview keeps its tokenized lines
+            self.runs = {}
         self._close_source()
 
         self.max_width = 0
-        if isinstance(source, str):
+        if isinstance(source, MappedFile):
+            # the width of the lines read so far, see _get_line()
+            self.source_is_stream = False
+            self.lines = source
+        elif isinstance(source, str):
             self.source_is_stream = False
             self.lines = source.splitlines()
             if self.lines:
@@ -200,7 +315,7 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
             return False
         self.markup = 'ansi'
 
-        if not self.source_is_stream and strip:
+        if not self.source_is_stream and not isinstance(source, MappedFile) and strip:
             self.lines = [line.strip() for line in self.lines]
 
         self.source = source
@@ -216,7 +331,7 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     def _get_line(self, n, attempt_to_read=True):
         assert isinstance(n, int), n
         try:
-            return self.lines[n]
+            line = self.lines[n]
         except (KeyError, IndexError):
             if attempt_to_read and self.source_is_stream:
                 try:
@@ -230,19 +345,34 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
                     pass
                 return self._get_line(n, attempt_to_read=False)
             return ""
+        if isinstance(self.lines, MappedFile) and len(line) > self.max_width:
+            self.max_width = len(line)
+        return line
+
+    def _get_runs(self, n):
+        """Returns the line tokenized by ansi.tokenize(), parsing it only once"""
+        runs = self.runs.get(n)
+        if runs is None:
+            runs = ansi.tokenize(self._get_line(n).expandtabs(4).rstrip('\r\n'))
+            # lines which may still be read later are empty meanwhile
+            if runs:
+                if len(self.runs) >= self.runs_cache_max:
+                    self.runs.clear()
+                self.runs[n] = runs
+        return runs
 
     def _generate_lines(self, starty, startx):
+        """Generate the visible part of the lines, as runs with the ansi markup"""
         i = starty
         if not self.source:
-            raise StopIteration
+            return
         while True:
             try:
-                line = self._get_line(i).expandtabs(4)
                 if self.markup == 'ansi':
-                    line = ansi.char_slice(line, startx, self.wid) + ansi.reset
+                    yield ansi.slice_runs(self._get_runs(i), startx, self.wid)
                 else:
-                    line = line[startx:self.wid + startx]
-                yield line.rstrip().replace('\r\n', '\n')
+                    line = self._get_line(i).expandtabs(4)[startx:self.wid + startx]
+                    yield line.rstrip().replace('\r\n', '\n')
             except IndexError:
-                raise StopIteration
+                return
             i += 1
@@ -22,6 +22,9 @@ from ranger.gui.bar import Bar
 
 from . import Widget
 
+# Seconds after which the free space of the file system is looked up again
+FREE_SPACE_TTL = 5
+
 
 class StatusBar(Widget):  # pylint: disable=too-many-instance-attributes
     __doc__ = __doc__
@@ -36,16 +39,37 @@ class StatusBar(Widget):  # pylint: disable=too-many-instance-attributes
     old_du = None
     old_hint = None
     result = None
+    free_space = None
+    free_space_path = None
+    free_space_time = 0
 
     def __init__(self, win, column=None):
         Widget.__init__(self, win)
         self.column = column
         self.settings.signal_bind('setopt.display_size_in_status_bar',
                                   self.request_redraw, weak=True)
+        # file operations and commands are what change the free space
+        self.fm.signal_bind('loader.after', self._forget_free_space, weak=True)
+        self.fm.signal_bind('runner.execute.after', self._forget_free_space, weak=True)
 
     def request_redraw(self):
         self.need_redraw = True
 
+    def _forget_free_space(self):
+        if self.free_space_time:
+            self.free_space_time = 0
+            self.need_redraw = True
+
+    def _get_free_space(self, path):
+        if path != self.free_space_path or not self.free_space_time:
+            try:
+                self.free_space = get_free_space(path)
+            except OSError:
+                self.free_space = None
+            self.free_space_path = path
+            self.free_space_time = time()
+        return self.free_space
+
     def notify(self, text, duration=0, bad=False):
         self.msg = Message(text, duration, bad)
 
@@ -98,6 +122,9 @@ class StatusBar(Widget):  # pylint: disable=too-many-instance-attributes
             self.old_ctime = ctime
             self.need_redraw = True
 
+        if self.free_space_time and time() - self.free_space_time > FREE_SPACE_TTL:
+            self._forget_free_space()
+
         if self.need_redraw:
             self.need_redraw = False
 
@@ -269,18 +296,13 @@ class StatusBar(Widget):  # pylint: disable=too-many-instance-attributes
             if len(target.marked_items) == target.size:
                 right.add(human_readable(target.disk_usage, separator=''))
             else:
-                sumsize = sum(f.size for f in target.marked_items
-                              if not f.is_directory or f.cumulative_size_calculated)
-                right.add(human_readable(sumsize, separator=''))
+                right.add(human_readable(target.marked_size, separator=''))
             right.add("/" + str(len(target.marked_items)))
         else:
             right.add(human_readable(target.disk_usage, separator='') + " sum")
             if self.settings.display_free_space_in_status_bar:
-                try:
-                    free = get_free_space(target.mount_path)
-                except OSError:
-                    pass
-                else:
+                free = self._get_free_space(target.mount_path)
+                if free is not None:
                     right.add(", ", "space")
                     right.add(human_readable(free, separator='') + " free")
         right.add("  ", "space")
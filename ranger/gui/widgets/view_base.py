@@ -20,7 +20,6 @@ class ViewBase(Widget, DisplayableContainer):  # pylint: disable=too-many-instan
     def __init__(self, win):  # pylint: disable=super-init-not-called
         DisplayableContainer.__init__(self, win)
 
-        self.fm.signal_bind('move', self.request_clear)
         self.old_draw_borders = self.settings.draw_borders
 
         self.columns = None
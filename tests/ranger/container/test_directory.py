@@ -0,0 +1,68 @@
+from __future__ import (absolute_import, division, print_function)
+
+from ranger.container.directory import Directory
+from ranger.container.file import File
+
+
+class MockFM(object):  # pylint: disable=too-few-public-methods
+    """Used to fulfill the dependency by FileSystemObject."""
+
+    default_linemodes = []
+
+    def update_preview(self, path):
+        pass
+
+
+class MockSettings(object):  # pylint: disable=too-few-public-methods
+    """Used to fulfill the dependency by FileSystemObject.load."""
+
+    freeze_files = False
+
+
+def create_file(path):
+    """Create a loaded File without fm and settings objects."""
+    fobj = File.__new__(File)
+    fobj.fm = MockFM()
+    fobj.settings = MockSettings()
+    fobj.__init__(path)
+    fobj.load()
+    return fobj
+
+
+def create_directory(path, files):
+    """Create a Directory with the given files, without loading it."""
+    directory = Directory.__new__(Directory)
+    directory.path = path
+    directory.marked_items = []
+    directory._marked_sizes = {}  # pylint: disable=protected-access
+    directory.files = files
+    directory.filenames = [fobj.path for fobj in files]
+    return directory
+
+
+def test_marked_size(tmpdir):
+    small = tmpdir.join('small')
+    small.write('x' * 100)
+    files = [create_file(str(small)), create_file(str(tmpdir.join('empty').ensure()))]
+    directory = create_directory(str(tmpdir), files)
+
+    directory.mark_item(files[0], True)
+    directory.mark_item(files[1], True)
+    assert directory.marked_size == 100
+
+    # The file grows while it is marked and is reloaded
+    small.write('x' * 5000, mode='a')
+    files[0].load()
+    assert files[0].size == 5100
+
+    directory.mark_item(files[0], False)
+    assert directory.marked_size == 0
+    directory.mark_item(files[0], True)
+    assert directory.marked_size == 5100
+
+    directory.count_marked_size()
+    assert directory.marked_size == 5100
+    directory.mark_item(files[1], False)
+    directory.mark_item(files[0], False)
+    assert directory.marked_size == 0
+    assert not directory.marked_items
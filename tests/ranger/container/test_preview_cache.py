@@ -0,0 +1,153 @@
+from __future__ import (absolute_import, division, print_function)
+
+from binascii import hexlify
+import os
+
+from ranger.container.preview_cache import (
+    ENTRY_OVERHEAD, PreviewCache, PreviewDiskCache, ThumbnailCache)
+
+
+def test_lookup():
+    cache = PreviewCache(maxsize=0)
+    assert cache.lookup('/a', 80, 24) is False
+    cache['/a'] = {'loading': False}
+    cache.store('/a', (-1, 24), 'text')
+    assert cache.lookup('/a', 80, 24) == 'text'
+    assert cache.lookup('/a', 100, 24) == 'text'
+    assert cache.lookup('/a', 80, 25) is False
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 2
+
+
+def test_promotion():
+    cache = PreviewCache(maxsize=0)
+    cache['/a'] = {'loading': False}
+    cache.store('/a', (80, 24), 'text')
+    cache.store('/a', (80, 30), 'text')
+    # The same content for two sizes does not make it fit any size
+    assert cache.lookup('/a', 80, 25) is False
+    assert cache.lookup('/a', 60, 24) is False
+
+    # Previews for any height replace the ones of the width
+    cache.store('/a', (100, 24), 'wide')
+    cache.store('/a', (80, -1), 'text')
+    assert sorted(key for key in cache['/a'] if isinstance(key, tuple)) == [
+        (80, -1), (100, 24)]
+    assert cache.lookup('/a', 80, 25) == 'text'
+    cache.store('/a', (-1, -1), 'text')
+    assert [key for key in cache['/a'] if isinstance(key, tuple)] == [(-1, -1)]
+    assert cache.size == ENTRY_OVERHEAD + len('/a') + len('text')
+
+
+def test_eviction():
+    cache = PreviewCache(maxsize=3 * (ENTRY_OVERHEAD + 1000))
+    for path in ('/a', '/b', '/c'):
+        cache[path] = {'loading': False}
+        cache.store(path, (-1, -1), 'x' * (1000 - len(path)))
+    assert len(cache) == 3
+
+    # Loading entries and recently used entries are kept
+    cache['/a']['loading'] = True
+    cache['/b']  # pylint: disable=pointless-statement
+    cache['/d'] = {'loading': False}
+    cache.store('/d', (-1, -1), 'x' * 500)
+    assert '/a' in cache
+    assert '/b' in cache
+    assert '/c' not in cache
+    assert '/d' in cache
+    assert cache.size <= cache.maxsize
+
+    del cache['/a']
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_disk_cache(tmpdir):
+    cachedir = tmpdir.mkdir('cache')
+    source = tmpdir.join('source.txt')
+    source.write('content')
+    path = str(source)
+    cache = PreviewDiskCache(path=str(cachedir), maxsize=10000)
+
+    stat = os.stat(path)
+    assert cache.get(path, stat, 80, 24, 'script') is None
+    cache.put(path, (-1, 24), u'preview \u2713', stat, 'script')
+    assert cache.get(path, stat, 100, 24, 'script') == ((-1, 24), u'preview \u2713')
+    assert cache.get(path, stat, 100, 25, 'script') is None
+    assert cache.get(path, stat, 100, 24, 'other script') is None
+
+    # Changing the file makes its previews unreachable
+    source.write('changed content')
+    assert cache.get(path, os.stat(path), 100, 24, 'script') is None
+
+
+def test_disk_cache_clean(tmpdir):
+    cachedir = tmpdir.mkdir('cache')
+    cache = PreviewDiskCache(path=str(cachedir), maxsize=10000)
+    for i in range(20):
+        source = tmpdir.join('source{0:d}.txt'.format(i))
+        source.write('content')
+        text = hexlify(os.urandom(1000)).decode('ascii')
+        cache.put(str(source), (-1, -1), text, os.stat(str(source)), 'script')
+    assert cache.size <= 10000
+    assert sum(entry.size() for entry in cachedir.listdir()) == cache.size
+
+
+def test_thumbnails(tmpdir):
+    cachedir = tmpdir.mkdir('cache')
+    thumbdir = cachedir.join('thumbnails')
+    cache = ThumbnailCache(path=str(thumbdir), maxsize=7000)
+    sources = []
+    for i in range(4):
+        source = tmpdir.join('image{0:d}.png'.format(i))
+        source.write('image')
+        sources.append((str(source), os.stat(str(source))))
+
+    path, stat = sources[0]
+    assert cache.get(path, stat, 80) is None
+    assert cache.filename(path, stat, 80) == cache.filename(path, stat, 100)
+    assert cache.filename(path, stat, 80) != cache.filename(path, stat, 200)
+
+    # The preview script writes the thumbnails, then they are added
+    for i, (path, stat) in enumerate(sources):
+        with open(cache.prepare(path, stat, 80), 'wb') as fobj:
+            fobj.write(b'x' * 2000)
+        cache.add(path, stat, 80)
+        if i == 2:
+            cache.get(sources[0][0], sources[0][1], 80)
+    assert cache.get(*sources[0], width=80) is not None
+    assert cache.get(*sources[1], width=80) is None
+    assert len(cache.index) == 2
+
+    # Another instance reads the index once it is saved
+    cache.save()
+    assert sorted(ThumbnailCache(path=str(thumbdir)).index) == sorted(cache.index)
+
+    # Thumbnails of older versions are only deleted for files in the index
+    legacy = cachedir.join(ThumbnailCache._legacy_name(  # pylint: disable=protected-access
+        sources[0][0]))
+    legacy.write('old')
+    unknown = cachedir.join('0123456789abcdef0123456789abcdef01234567.jpg')
+    unknown.write('unknown')
+    thumbdir.join('stray').write('stray')
+    tmpdir.join('image3.png').remove()
+    assert cache.clean() == 3
+    assert sorted(entry.basename for entry in thumbdir.listdir()) == sorted(
+        [ThumbnailCache.INDEX] + list(cache.index))
+    assert not legacy.exists()
+    assert unknown.exists()
+
+
+def test_thumbnails_temporary(tmpdir):
+    source = tmpdir.join('image.png')
+    source.write('image')
+    stat = os.stat(str(source))
+    cache = ThumbnailCache(path=None, maxsize=0)
+    with open(cache.prepare(str(source), stat, 80), 'wb') as fobj:
+        fobj.write(b'x' * 2000)
+    cache.add(str(source), stat, 80)
+    thumbdir = cache.path
+    assert cache.get(str(source), stat, 80).startswith(thumbdir)
+
+    cache.destroy()
+    assert not os.path.exists(thumbdir)
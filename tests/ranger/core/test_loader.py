@@ -0,0 +1,52 @@
+from __future__ import (absolute_import, division, print_function)
+
+import time
+
+from ranger.core.loader import CommandLoader, CommandPool
+
+
+def _work(pool, timeout=5):
+    end = time.time() + timeout
+    while pool.has_work() and time.time() < end:
+        pool.work()
+
+
+def test_command_pool():
+    pool = CommandPool(size=2)
+    outputs = []
+    for i in range(4):
+        loadable = CommandLoader(['sh', '-c', 'sleep 0.2; echo {0:d}'.format(i)],
+                                 'test', read=True, silent=True)
+        loadable.signal_bind('after', lambda signal: outputs.append(
+            (signal.process.poll(), signal.loader.stdout_buffer)))
+        pool.add(loadable, append=True)
+
+    time1 = time.time()
+    _work(pool)
+    assert not pool.has_work()
+    assert time.time() - time1 < 0.7
+    assert sorted(outputs) == [(0, '0\n'), (0, '1\n'), (0, '2\n'), (0, '3\n')]
+    pool.destroy()
+
+
+def test_command_pool_remove():
+    pool = CommandPool(size=1)
+    outputs = []
+    destroyed = []
+    running = CommandLoader(['sleep', '10'], 'test', read=True, silent=True)
+    delayed = CommandLoader(['echo', 'delayed'], 'test', read=True, silent=True, delay=10)
+    for loadable in (running, delayed):
+        loadable.signal_bind('after', lambda signal: outputs.append(signal.loader))
+        loadable.signal_bind('destroy', lambda signal: destroyed.append(signal.loader))
+        pool.add(loadable)
+
+    end = time.time() + 5
+    while running.process is None and time.time() < end:
+        pool.work()
+    pool.remove(running)
+    pool.remove(delayed)
+    _work(pool)
+    assert not outputs
+    assert destroyed == [running, delayed]
+    assert delayed.process is None
+    pool.destroy()
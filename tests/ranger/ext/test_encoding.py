@@ -0,0 +1,67 @@
+from __future__ import (absolute_import, division, print_function)
+
+import codecs
+
+from ranger.ext import encoding
+from ranger.ext.encoding import StreamDecoder, detect, file_encoding
+
+
+def test_detect():
+    assert detect(codecs.BOM_UTF16_LE + u'abc'.encode('utf-16-le')) == 'utf-16'
+    assert detect(codecs.BOM_UTF32_LE + u'abc'.encode('utf-32-le')) == 'utf-32'
+    assert detect(u'abc'.encode('utf-16-be')) == 'utf-16-be'
+    # a character cut off at the end of the prefix
+    assert detect(b'a' * (encoding.SNIFF_SIZE - 1) + u'\xe4'.encode('utf-8')) == 'utf-8'
+
+
+def test_file_encoding(tmpdir, monkeypatch):
+    path = tmpdir.join('text')
+    path.write_binary(codecs.BOM_UTF8 + b'text')
+    assert file_encoding(str(path)) == 'utf-8-sig'
+
+    detected = []
+    monkeypatch.setattr(encoding, 'detect', lambda data: detected.append(data) or 'utf-8')
+    assert file_encoding(str(path)) == 'utf-8-sig'
+    assert not detected
+    path.write_binary(b'modified text')
+    assert file_encoding(str(path)) == 'utf-8'
+    assert detected == [b'modified text']
+
+
+def test_stream_decoder():
+    text = u'\xe4\xf6\xfc €' * 200
+    data = text.encode('utf-8')
+    decoder = StreamDecoder()
+    chunks = [decoder.decode(data[i:i + 7]) for i in range(0, len(data), 7)]
+    assert u''.join(chunks) + decoder.decode(b'', final=True) == text
+    assert decoder.encoding is None
+
+    text = u'caf\xe9 ' * 200
+    data = text.encode('latin-1')
+    decoder = StreamDecoder()
+    chunks = [decoder.decode(data[i:i + 512]) for i in range(0, len(data), 512)]
+    assert u''.join(chunks) == text
+    assert decoder.encoding is not None
+
+
+def test_stream_decoder_invalid_byte():
+    # One invalid byte among UTF-8 text does not switch the encoding
+    text = u'\xe4\xf6\xfc \u20ac' * 200
+    data = b'abc\xff' + text.encode('utf-8')
+    decoder = StreamDecoder()
+    chunks = [decoder.decode(data[i:i + 512]) for i in range(0, len(data), 512)]
+    assert u''.join(chunks) + decoder.decode(b'', final=True) == u'abc\ufffd' + text
+    assert decoder.encoding == 'utf-8'
+
+    # Neither after UTF-8 text in earlier chunks
+    decoder = StreamDecoder()
+    assert decoder.decode(u'caf\xe9\n'.encode('utf-8')) == u'caf\xe9\n'
+    assert decoder.decode(b'x\xffy \xe9 ') == u'x\ufffdy \ufffd '
+    assert decoder.decode(u'\u20ac'.encode('utf-8'), final=True) == u'\u20ac'
+    assert decoder.encoding == 'utf-8'
+
+    # An incomplete character is no sign of UTF-8
+    decoder = StreamDecoder()
+    decoder.decode(b'caf\xe9')
+    decoder.decode(b' caf\xe9 caf\xe9', final=True)
+    assert decoder.encoding != 'utf-8'
@@ -0,0 +1,122 @@
+from __future__ import (absolute_import, division, print_function)
+
+from collections import OrderedDict
+import sys
+
+import pytest
+
+from ranger.ext.vcs import Vcs
+from ranger.ext.vcs.hgcmdserver import CommandServer, CommandServerError
+
+
+# A stand-in for `hg serve --cmdserver pipe`, answering "echo", "input",
+# "fail" and "crash" commands
+SERVER = r'''
+import os, struct, sys
+stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+
+def write(channel, data):
+    stdout.write(channel + struct.pack('>I', len(data)) + data)
+    stdout.flush()
+
+write(b'o', b'capabilities: getencoding runcommand\nencoding: UTF-8\npid: '
+      + str(os.getpid()).encode('ascii'))
+while True:
+    line = stdin.readline()
+    if not line:
+        break
+    length = struct.unpack('>I', stdin.read(4))[0]
+    args = stdin.read(length).split(b'\0')
+    if args[0] == b'crash':
+        sys.exit(1)
+    elif args[0] == b'input':
+        stdout.write(b'L' + struct.pack('>I', 4096))
+        stdout.flush()
+        assert stdin.read(4) == struct.pack('>I', 0)
+    write(b'e', b'ignored')
+    write(b'o', b' '.join(args[1:]))
+    write(b'o', str(os.getpid()).encode('ascii'))
+    write(b'r', struct.pack('>i', 1 if args[0] == b'fail' else 0))
+'''
+
+
+@pytest.fixture
+def cmdserver(tmpdir):
+    script = tmpdir.join('server.py')
+    script.write(SERVER)
+    server = CommandServer(str(tmpdir), command=[sys.executable, str(script)])
+    yield server
+    server.close()
+
+
+def test_runcommand(cmdserver):  # pylint: disable=redefined-outer-name
+    returncode, output = cmdserver.runcommand([b'echo', b'hello', b'world'])
+    assert returncode == 0
+    assert output.startswith(b'hello world')
+    assert 'runcommand' in cmdserver.capabilities
+    assert cmdserver.encoding == 'UTF-8'
+
+    # The server process is reused
+    pid = cmdserver.process.pid
+    assert cmdserver.runcommand([b'input'])[1] == str(pid).encode('ascii')
+    assert cmdserver.runcommand([b'fail'])[0] == 1
+    assert cmdserver.process.pid == pid
+
+
+def test_restart(cmdserver):  # pylint: disable=redefined-outer-name
+    cmdserver.runcommand([b'echo'])
+    pid = cmdserver.process.pid
+    with pytest.raises(CommandServerError):
+        cmdserver.runcommand([b'crash'])
+    assert cmdserver.process is None
+
+    returncode, output = cmdserver.runcommand([b'echo'])
+    assert returncode == 0
+    assert output != str(pid).encode('ascii')
+
+
+def test_missing_server(tmpdir):
+    cmdserver = CommandServer(str(tmpdir), command=[str(tmpdir.join('missing'))])
+    with pytest.raises(CommandServerError):
+        cmdserver.runcommand([b'echo'])
+    assert cmdserver.unavailable
+
+    # The failure is remembered, the server is not started again
+    script = tmpdir.join('server.py')
+    script.write(SERVER)
+    cmdserver.command = [sys.executable, str(script)]
+    with pytest.raises(CommandServerError):
+        cmdserver.runcommand([b'echo'])
+    assert cmdserver.process is None
+
+
+def test_vcs_cmdservers(tmpdir, monkeypatch):
+    script = tmpdir.join('server.py')
+    script.write(SERVER)
+    monkeypatch.setattr(CommandServer, 'command', [sys.executable, str(script)])
+    cmdservers = OrderedDict()
+    monkeypatch.setattr(Vcs, '_cmdservers', cmdservers)
+    monkeypatch.setattr(Vcs, 'CMDSERVERS_MAXSIZE', 2)
+    repos = []
+    for name in ('a', 'b', 'c'):
+        vcs = Vcs.__new__(Vcs)
+        vcs.root = vcs.path = str(tmpdir.mkdir(name))
+        repos.append(vcs)
+
+    for vcs in repos[:2]:
+        vcs._run_cmdserver(['echo'])  # pylint: disable=protected-access
+    servers = dict(cmdservers)
+    assert all(server.process is not None for server in servers.values())
+
+    # The least recently used server is stopped
+    repos[0]._run_cmdserver(['echo'])  # pylint: disable=protected-access
+    repos[2]._run_cmdserver(['echo'])  # pylint: disable=protected-access
+    assert list(cmdservers) == [repos[0].root, repos[2].root]
+    assert servers[repos[1].root].process is None
+    assert servers[repos[1].root].unavailable
+
+    servers = list(cmdservers.values())
+    Vcs.cmdservers_close()
+    assert not cmdservers
+    assert all(server.process is None for server in servers)
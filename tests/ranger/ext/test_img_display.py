@@ -0,0 +1,47 @@
+from __future__ import (absolute_import, division, print_function)
+
+import threading
+import time
+
+from ranger.ext.img_display import ImagePreparer
+
+
+def _wait(preparer, key, *args):
+    end = time.time() + 5
+    while time.time() < end:
+        result = preparer.prepare(key, *args)
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    return None
+
+
+def test_image_preparer_drops_stale_requests():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def prepare(path):
+        calls.append(path)
+        if path == 'a':
+            started.set()
+            release.wait(5)
+        if path == 'error':
+            raise IOError('unreadable')
+        return path.upper()
+
+    preparer = ImagePreparer(prepare)
+    assert preparer.prepare('a', 'a') is None
+    assert started.wait(5)
+    # b is replaced by c before the worker gets to it
+    assert preparer.prepare('b', 'b') is None
+    assert preparer.prepare('c', 'c') is None
+    assert preparer.busy()
+    release.set()
+    assert _wait(preparer, 'c', 'c') == ('C', None)
+    assert calls == ['a', 'c']
+    assert not preparer.busy()
+
+    payload, exception = _wait(preparer, 'error', 'error')
+    assert payload is None and isinstance(exception, IOError)
+    preparer.quit()
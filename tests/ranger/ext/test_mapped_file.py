@@ -0,0 +1,63 @@
+from __future__ import (absolute_import, division, print_function)
+
+import re
+
+import pytest
+
+from ranger.ext import mapped_file
+from ranger.ext.mapped_file import MappedFile
+
+
+def test_mapped_file(tmpdir, monkeypatch):
+    monkeypatch.setattr(mapped_file, 'BLOCK_SIZE', 64)
+    monkeypatch.setattr(mapped_file, 'INDEX_MAX', 16)
+    monkeypatch.setattr(mapped_file, 'SYNC_MAX', 0)
+    lines = ['line {0:d} '.format(i) + 'x' * (i % 7) for i in range(1000)]
+    lines[500] = u'äöü'
+    path = tmpdir.join('text')
+    path.write_binary(('\r\n'.join(lines) + '\n').encode('utf-8'))
+
+    mapped = MappedFile(str(path))
+    len(mapped)
+    mapped._thread.join()  # pylint: disable=protected-access
+    assert mapped.complete
+    assert len(mapped) == len(lines)
+    assert len(mapped._index[1]) <= 16  # pylint: disable=protected-access
+    for i in (999, 0, 500, 1, 2, 3, 998, 250):
+        assert mapped[i] == lines[i]
+    assert list(mapped) == lines
+    with pytest.raises(IndexError):
+        mapped[1000]  # pylint: disable=pointless-statement
+    mapped.close()
+
+    path.write_binary(b'without line ending')
+    mapped = MappedFile(str(path))
+    assert list(mapped) == ['without line ending']
+    mapped.close()
+
+    path.write_binary(b'')
+    with pytest.raises(ValueError):
+        MappedFile(str(path))
+
+
+def _search(mapped, pattern, start, backward=False):
+    results = [line for line in mapped.search(re.compile(pattern, re.M), start, backward)
+               if line is not None]
+    return results[0] if results else None
+
+
+def test_mapped_file_search(tmpdir, monkeypatch):
+    monkeypatch.setattr(mapped_file, 'SEARCH_CHUNK_SIZE', 100)
+    path = tmpdir.join('text')
+    path.write_binary(b''.join(b'line %d\n' % i for i in range(1000)))
+    mapped = MappedFile(str(path))
+    len(mapped)
+    assert _search(mapped, b'line 5', 0) == 5
+    assert _search(mapped, b'line 5', 6) == 50
+    assert _search(mapped, b'^line 99$', 0) == 99
+    assert _search(mapped, b'line 5', 50, backward=True) == 5
+    assert _search(mapped, b'line 5', 5, backward=True) is None
+    assert _search(mapped, b'^', 999) == 999
+    assert _search(mapped, b'$', 999, backward=True) == 998
+    assert _search(mapped, b'line 1000', 0) is None
+    mapped.close()
@@ -0,0 +1,86 @@
+from __future__ import (absolute_import, division, print_function)
+
+import io
+import json
+import os
+import struct
+import tarfile
+import zipfile
+
+from ranger.ext import previewers
+
+
+def test_archives(tmpdir, monkeypatch):
+    path = str(tmpdir.join('archive.zip'))
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('dir/file', 'content')
+        archive.comment = b'comment'
+    code, text = previewers.preview(path, 80, 24)
+    assert code == 5
+    assert text.rstrip().endswith('dir/file')
+
+    # Large central directories are left to the preview script
+    monkeypatch.setattr(previewers, 'ZIP_DIRECTORY_MAX', 10)
+    assert previewers.preview(path, 80, 24) is None
+
+    path = str(tmpdir.join('archive.tar.gz'))
+    with tarfile.open(path, 'w:gz') as archive:
+        for i in range(previewers.LIST_MAX + 1):
+            info = tarfile.TarInfo('file{0:d}'.format(i))
+            info.size = 1
+            archive.addfile(info, io.BytesIO(b'x'))
+    code, text = previewers.preview(path, 80, 24)
+    assert code == 5
+    assert text.splitlines()[0].endswith('file0')
+    assert text.splitlines()[-1] == '... more entries'
+
+    # Large members are skipped by decompressing them, which is cut off
+    path = str(tmpdir.join('large.tar.gz'))
+    with tarfile.open(path, 'w:gz') as archive:
+        for i in range(3):
+            info = tarfile.TarInfo('large{0:d}'.format(i))
+            info.size = previewers.TAR_DECOMPRESS_MAX // 2
+            archive.addfile(info, io.BytesIO(b'\0' * info.size))
+    code, text = previewers.preview(path, 80, 24)
+    assert code == 5
+    assert [line.split()[-1] for line in text.splitlines()] == [
+        'large0', 'large1', 'entries']
+
+    # Not an archive after all, leave it to the preview script
+    path = str(tmpdir.join('broken.tgz'))
+    with open(path, 'wb') as fobj:
+        fobj.write(b'\0' * 100)
+    assert previewers.preview(path, 80, 24) is None
+
+
+def test_has_previewers():
+    assert previewers.has_previewers('/archive.TAR.GZ')
+    assert previewers.has_previewers('/archive.tgz')
+    assert not previewers.has_previewers('/access.log.gz')
+    assert not previewers.has_previewers('/.tar')
+    assert not previewers.has_previewers('/script.sh')
+
+
+def test_json(tmpdir):
+    path = str(tmpdir.join('data.json'))
+    with open(path, 'w') as fobj:
+        json.dump({'key': [1, 2]}, fobj)
+    assert previewers.preview(path, 80, 24) == (5, '{\n  "key": [\n    1,\n    2\n  ]\n}\n')
+    with open(path, 'w') as fobj:
+        fobj.write('{broken')
+    assert previewers.preview(path, 80, 24) == (2, None)
+
+
+def test_images(tmpdir):
+    headers = {
+        'PNG': (b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR' + struct.pack('>II', 640, 480)
+                + b'\x08\x02\0\0\0'),
+        'GIF': b'GIF89a' + struct.pack('<HH', 640, 480),
+        'JPEG': (b'\xff\xd8\xff\xe0\0\x10JFIF\0' + b'\0' * 9
+                 + b'\xff\xc0\0\x11\x08' + struct.pack('>HH', 480, 640) + b'\x03'),
+    }
+    for kind, header in headers.items():
+        path = os.path.join(str(tmpdir), 'image.' + kind.lower())
+        with open(path, 'wb') as fobj:
+            fobj.write(header + b'\0' * 32)
+        assert previewers.preview(path, 80, 24) == (5, 'Image: {0}\nSize: 640x480\n'.format(kind))
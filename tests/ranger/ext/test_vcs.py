@@ -0,0 +1,303 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import subprocess
+
+import pytest
+
+from ranger.ext.get_executables import get_executables
+from ranger.ext.vcs.vcs import Vcs, VcsError, GitRoot
+
+
+def create_vcsroot(status_subpaths):
+    """Create a VcsRoot without a directory object."""
+    rootvcs = GitRoot.__new__(GitRoot)
+    rootvcs.path = '/repo'
+    rootvcs.status_subpaths = status_subpaths
+    rootvcs.status_dirs = rootvcs._status_dirs_build(  # pylint: disable=protected-access
+        rootvcs.status_subpaths)
+    return rootvcs
+
+
+def test_status_subpath():
+    rootvcs = create_vcsroot({
+        'a/b/changed.txt': 'changed',
+        'a/b/c/conflict.txt': 'conflict',
+        'a/staged.txt': 'staged',
+        'd/ignored.txt': 'ignored',
+        'e': 'untracked',
+    })
+
+    # Paths and their parents with a status
+    assert rootvcs.status_subpath('/repo/a/b/changed.txt') == 'changed'
+    assert rootvcs.status_subpath('/repo/e/sub/file', is_directory=True) == 'untracked'
+
+    # Directories get the most important status of their contents
+    assert rootvcs.status_subpath('/repo/a', is_directory=True) == 'conflict'
+    assert rootvcs.status_subpath('/repo/a/b', is_directory=True) == 'conflict'
+    assert rootvcs.status_subpath('/repo/a/b/c', is_directory=True) == 'conflict'
+
+    # Statuses not in DIRSTATUSES are not inherited
+    assert rootvcs.status_subpath('/repo/d', is_directory=True) == 'sync'
+    assert rootvcs.status_subpath('/repo/f', is_directory=True) == 'sync'
+    assert rootvcs.status_subpath('/repo/a/other.txt') == 'sync'
+
+    assert rootvcs._status_root() == 'conflict'  # pylint: disable=protected-access
+
+
+def test_status_subpath_clean():
+    rootvcs = create_vcsroot({'d/ignored.txt': 'ignored'})
+    assert rootvcs._status_root() == 'sync'  # pylint: disable=protected-access
+
+
+class MockSettings(object):  # pylint: disable=too-few-public-methods
+    vcs_backend_bzr = 'disabled'
+    vcs_backend_git = 'enabled'
+    vcs_backend_hg = 'disabled'
+    vcs_backend_svn = 'disabled'
+
+
+class MockDirectory(object):  # pylint: disable=too-few-public-methods
+    """Used to fulfill the dependency by Vcs."""
+
+    settings = MockSettings()
+    is_link = False
+
+    def __init__(self, path):
+        self.path = self.realpath = path
+
+
+def test_root_cache(tmpdir):
+    repo = tmpdir.mkdir('repo')
+    for name in ('sub1', 'sub2'):
+        repo.mkdir(name)
+
+    Vcs._root_cache.clear()  # pylint: disable=protected-access
+    vcs = Vcs.__new__(Vcs)
+    vcs.obj = MockDirectory(str(repo.join('sub1')))
+    vcs.path = vcs.obj.path
+    vcs.repotypes_settings = set(['git'])
+
+    # Negative results are shared by siblings
+    assert vcs._find_root(vcs.path)[0] is None  # pylint: disable=protected-access
+    assert str(repo) in Vcs._root_cache  # pylint: disable=protected-access
+    repo.mkdir('.git')
+    assert vcs._find_root(str(repo.join('sub2')))[0] is None  # pylint: disable=protected-access
+
+    # Until the repository path is invalidated
+    Vcs.root_cache_invalidate(str(repo))
+    assert vcs._find_root(vcs.path)[0] == str(repo)  # pylint: disable=protected-access
+
+
+class MockFM(object):  # pylint: disable=too-few-public-methods
+    """Used to fulfill the dependency by VcsRoot."""
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def cachepath(self, *paths):
+        return '/'.join((self.cachedir,) + paths)
+
+
+def test_cache_load(tmpdir):
+    signal = tmpdir.join('index')
+    signal.write('index')
+    rootvcs = create_vcsroot({'a/changed.txt': 'changed'})
+    rootvcs.obj = MockDirectory('/repo')
+    rootvcs.obj.fm = MockFM(str(tmpdir.mkdir('cache')))
+    rootvcs.data_outdated_signals = lambda root_info: [str(signal)]
+    assert rootvcs.cache_load() is None
+
+    rootvcs._cache_save({  # pylint: disable=protected-access
+        'outdated_signature': rootvcs._outdated_signature(  # pylint: disable=protected-access
+            None),
+        'status_subpaths': rootvcs.status_subpaths,
+    }, {
+        'head': None,
+        'branch': 'master',
+        'upstream': None,
+        'remotestatus': 'sync',
+        'ahead': None,
+        'behind': None,
+    })
+    state = rootvcs.cache_load()
+    assert state['cached']
+    assert state['status_dirs'] == {'': 'changed', 'a': 'changed'}
+
+    # The repository changed since
+    signal.write('changed index')
+    assert rootvcs.cache_load() is None
+
+
+class MockFile(object):  # pylint: disable=too-few-public-methods
+    """A loaded file."""
+
+    def __init__(self, path):
+        self.path = path
+
+
+def test_check_outdated(tmpdir):
+    source = tmpdir.join('source.c')
+    source.write('int a;')
+    rootvcs = create_vcsroot({})
+    rootvcs.path = str(tmpdir)
+    rootvcs.links = set()
+    rootvcs.data_outdated_signals = lambda root_info: []
+    rootvcs.outdated_signature = ()
+    rootvcs.obj = MockDirectory(str(tmpdir))
+    rootvcs.obj.fm = MockFM(None)
+    rootvcs.obj.content_loaded = True
+    # Files are not stat'ed, only their directories
+    rootvcs.obj.files_all = [MockFile(str(source)), MockFile(str(tmpdir.join('removed')))]
+    rootvcs.obj.fm.directories = {str(tmpdir): rootvcs.obj}
+
+    rootvcs.updatetime = tmpdir.mtime() + 1
+    assert not rootvcs.check_outdated()
+
+    # A file was added
+    tmpdir.join('new.c').write('int b;')
+    tmpdir.setmtime(rootvcs.updatetime + 1)
+    assert rootvcs.check_outdated()
+
+
+def test_git_worktree_signals(tmpdir):
+    repo = tmpdir.mkdir('repo')
+    worktree = tmpdir.mkdir('worktree')
+    repo.mkdir('.git').mkdir('worktrees').mkdir('worktree').join('commondir').write('../..\n')
+    repo.join('.git', 'worktrees', 'worktree', 'HEAD').write('ref: refs/heads/feature\n')
+    worktree.join('.git').write('gitdir: {0}\n'.format(repo.join('.git', 'worktrees', 'worktree')))
+
+    rootvcs = GitRoot.__new__(GitRoot)
+    rootvcs.root = str(worktree)
+    rootvcs.repodir = str(worktree.join('.git'))
+    signals = rootvcs.data_outdated_signals(None)
+    assert str(repo.join('.git', 'refs', 'heads')) in signals
+    assert str(repo.join('.git', 'refs', 'heads', 'feature')) in signals
+    assert str(repo.join('.git', 'worktrees', 'worktree', 'index')) in signals
+
+
+def git(*args):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            ['git', '-c', 'user.name=ranger', '-c', 'user.email=ranger@example.com'] + list(args),
+            stdout=devnull, stderr=devnull)
+
+
+def create_gitroot(path, cachedir):
+    """Create a GitRoot of a repository without a directory object."""
+    rootvcs = GitRoot.__new__(GitRoot)
+    rootvcs.path = rootvcs.root = path
+    rootvcs.repodir = os.path.join(path, '.git')
+    rootvcs.repotype = 'git'
+    rootvcs.links = set()
+    rootvcs.obj = MockDirectory(path)
+    rootvcs.obj.fm = MockFM(cachedir)
+    rootvcs.obj.fm.directories = {}
+    return rootvcs
+
+
+@pytest.mark.skipif('git' not in get_executables(), reason='git is not installed')
+def test_cache_upstream(tmpdir):
+    origin = str(tmpdir.join('origin'))
+    clone = str(tmpdir.join('clone'))
+    cachedir = str(tmpdir.mkdir('cache'))
+    git('init', '-q', origin)
+    git('-C', origin, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    git('clone', '-q', origin, clone)
+
+    rootvcs = create_gitroot(clone, cachedir)
+    assert rootvcs.cache_load() is None
+    assert rootvcs.update_root()
+    assert rootvcs.obj.vcsremotestatus == 'sync'
+    # The signature taken before the upstream was known is not reused
+    assert not rootvcs.check_outdated()
+
+    # The next session restores the state
+    rootvcs = create_gitroot(clone, cachedir)
+    state = rootvcs.cache_load()
+    assert state is not None
+    upstream = state['root_info']['upstream']
+    assert upstream
+    assert rootvcs.apply_root(state)
+    assert rootvcs.obj.vcsremotestatus == 'sync'
+    assert rootvcs.update_root()
+    assert not rootvcs.check_outdated()
+
+    # Until the upstream changes, HEAD stays the same
+    commit = subprocess.check_output(
+        ['git', '-C', clone, '-c', 'user.name=ranger', '-c', 'user.email=ranger@example.com',
+         'commit-tree', 'HEAD^{tree}', '-p', 'HEAD', '-m', 'upstream']).decode('ascii').strip()
+    git('-C', clone, 'update-ref', upstream, commit)
+    assert rootvcs.check_outdated()
+    assert create_gitroot(clone, cachedir).cache_load() is None
+
+
+def create_gitroot_mock(tmpdir, head, output):
+    """Create a GitRoot whose git commands output the for-each-ref output."""
+    gitdir = tmpdir.mkdir('.git')
+    if head is not None:
+        gitdir.join('HEAD').write(head)
+    rootvcs = GitRoot.__new__(GitRoot)
+    rootvcs.root = rootvcs.path = str(tmpdir)
+    rootvcs.repodir = str(gitdir)
+
+    def run(args, **_):
+        if args[0] == 'for-each-ref':
+            return output
+        if args[0] == 'symbolic-ref':
+            raise VcsError('fatal: ref HEAD is not a symbolic ref')
+        if args[0] == '--no-pager':
+            return '\0'.join(['abc1234', 'abc1234567', 'A U Thor <author@example.com>',
+                              '1500000000', 'Detached']) + '\0\0'
+        raise VcsError(args)
+    rootvcs._run = run  # pylint: disable=protected-access
+    return rootvcs
+
+
+HEAD_LINE = '\0'.join(
+    ['abc1234', 'abc1234567', 'A U Thor <author@example.com>', '1500000000', 'Subject', ''])
+
+
+@pytest.mark.parametrize('upstream,track,remotestatus,ahead,behind', [
+    ('refs/remotes/origin/master', '', 'sync', 0, 0),
+    ('refs/remotes/origin/master', 'ahead 2', 'ahead', 2, 0),
+    ('refs/remotes/origin/master', 'behind 3', 'behind', 0, 3),
+    ('refs/remotes/origin/master', 'ahead 1, behind 2', 'diverged', 1, 2),
+    ('refs/remotes/origin/master', 'gone', 'unknown', None, None),
+    ('', '', 'none', None, None),
+])
+def test_git_root_info(tmpdir, upstream, track, remotestatus, ahead, behind):
+    rootvcs = create_gitroot_mock(
+        tmpdir, 'ref: refs/heads/master\n', HEAD_LINE + upstream + '\0' + track)
+    info = rootvcs.data_root_info()
+    assert info['branch'] == 'master'
+    assert info['head']['short'] == 'abc1234'
+    assert info['head']['summary'] == 'Subject'
+    assert info['upstream'] == (upstream or None)
+    assert info['remotestatus'] == remotestatus
+    assert info['ahead'] == ahead
+    assert info['behind'] == behind
+
+
+def test_git_root_info_detached(tmpdir):
+    rootvcs = create_gitroot_mock(tmpdir, 'abc1234567\n', '')
+    info = rootvcs.data_root_info()
+    assert info['branch'] == 'detached'
+    assert info['head']['summary'] == 'Detached'
+    assert info['remotestatus'] == 'none'
+
+
+def test_git_root_info_unreadable_head(tmpdir):
+    # Falls back to git, which fails on a detached HEAD
+    rootvcs = create_gitroot_mock(tmpdir, None, '')
+    info = rootvcs.data_root_info()
+    assert info['branch'] == 'detached'
+    assert info['remotestatus'] == 'none'
+
+
+def test_git_root_info_no_commits(tmpdir):
+    rootvcs = create_gitroot_mock(tmpdir, 'ref: refs/heads/master\n', '')
+    info = rootvcs.data_root_info()
+    assert info['branch'] == 'master'
+    assert info['head'] is None
+    assert info['remotestatus'] == 'none'